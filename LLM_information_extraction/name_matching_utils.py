@@ -1,7 +1,16 @@
 from cleanco.clean import custom_basename, prepare_default_terms
 import rapidfuzz as rf
 import re
+import os
+import json
+import hashlib
+import functools
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from chunks_to_video_utils import deduplicate_asset_list
 
 ### PRE-PROCESSING ###
 
@@ -9,6 +18,42 @@ def could_be_ticker(name):
     # check if the name could be a ticker (e.g. short, all uppercase or lowercase, all letters (true for US only! otherwise use .isalnum()))
     return (name.isupper() or name.islower()) and len(name) <= 5 and name.isalpha()
 
+@functools.lru_cache(maxsize=None)
+def get_default_terms():
+    # cleanco's legal term table (prepare_default_terms() rebuilds and re-normalizes it on every call), built once
+    return prepare_default_terms()
+
+# data-specific removals for stock names (mostly related to share types), applied in this order after the legal term removal
+stock_removal_patterns = [re.compile(pattern) for pattern in [
+        r" Class A", # we only remove this for "A" class to match these easier than other classes!
+        r" ADR",
+        r" ADS",
+    ]] + [re.compile(pattern, flags=re.IGNORECASE) for pattern in [
+        r" American Depositary Shares",
+        r" Common Stock",
+        r" Common Shares",
+        r" Ordinary Shares",
+        r" ADR$", # remove case-insensitive only at the end
+        r" ADS$", # remove case-insensitive only at the end
+        # other
+        r"\.com",
+        r"^The ", # remove only if it's the first word
+    ]] # note: we don't remove terms such as "Warrants", "Units", "Rights" etc. to make matching these more difficult, usually there is a normal version of the stock which should be matched instead
+
+etf_removal_patterns = [re.compile(pattern, flags=re.IGNORECASE) for pattern in [
+        r" ETF",
+        r" Trust",
+        r" Fund",
+        r" Shares",
+        r" Index",
+    ]]
+whitespace_pattern = re.compile(r"\s+")
+
+crypto_removal_patterns = [re.compile(pattern, flags=re.IGNORECASE) for pattern in [
+        r"^The ", # remove only if it's the first word
+    ]]
+
+@functools.lru_cache(maxsize=2**18) # pure string -> string, the same names keep coming back (queries and candidates), bounded to not keep every name of a long session alive
 def get_stock_basename_or_ticker(full_name):
 
     # skip any cleaning if the name looks like a ticker
@@ -17,7 +62,7 @@ def get_stock_basename_or_ticker(full_name):
     
     # remove legal terms (using cleanco)
     name_without_legal_terms = custom_basename(full_name, 
-                                terms=prepare_default_terms(), 
+                                terms=get_default_terms(), 
                                 prefix=False, # we don't expect legal terms as first word in our dataset
                                 middle=True, 
                                 suffix=True)
@@ -27,33 +72,15 @@ def get_stock_basename_or_ticker(full_name):
     else:
         name = full_name
 
-    # further data-specific removals (mostly related to share types)
-    remove_exact = [
-        r" Class A", # we only remove this for "A" class to match these easier than other classes!
-        r" ADR",
-        r" ADS",
-    ]
-    remove_case_insensitive = [
-        r" American Depositary Shares",
-        r" Common Stock",
-        r" Common Shares",
-        r" Ordinary Shares",
-        r" ADR$", # remove case-insensitive only at the end
-        r" ADS$", # remove case-insensitive only at the end
-        # other
-        r"\.com",
-        r"^The ", # remove only if it's the first word
-    ] # note: we don't remove terms such as "Warrants", "Units", "Rights" etc. to make matching these more difficult, usually there is a normal version of the stock which should be matched instead
-
-    for pattern in remove_exact:
-        name = re.sub(pattern, "", name)
-    for pattern in remove_case_insensitive:
-        name = re.sub(pattern, "", name, flags=re.IGNORECASE)
+    # further data-specific removals (precompiled, see stock_removal_patterns)
+    for pattern in stock_removal_patterns:
+        name = pattern.sub("", name)
     
     # lowercase
     name = name.lower()
     return name
 
+@functools.lru_cache(maxsize=2**18)
 def get_etf_basename_or_ticker(full_name):
 
     # skip any cleaning if the name looks like a ticker
@@ -62,33 +89,24 @@ def get_etf_basename_or_ticker(full_name):
     else:
         name = full_name
 
-    # removals
-    remove_case_insensitive = [
-        r" ETF",
-        r" Trust",
-        r" Fund",
-        r" Shares",
-        r" Index",
-    ]
-    for pattern in remove_case_insensitive:
-        name = re.sub(pattern, "", name, flags=re.IGNORECASE)
+    # removals (precompiled, see etf_removal_patterns)
+    for pattern in etf_removal_patterns:
+        name = pattern.sub("", name)
     # replace hyphens with spaces
     name = name.replace("-", " ")
     # remove extra spaces
-    name = re.sub(r"\s+", " ", name)
+    name = whitespace_pattern.sub(" ", name)
     # lowercase
     name = name.lower()
     return name
 
+@functools.lru_cache(maxsize=2**18)
 def get_crypto_basename_or_ticker(full_name):
     # for cryptos we don't do much cleaning
     name = full_name
     # removals
-    remove_case_insensitive = [
-        r"^The ", # remove only if it's the first word
-    ]
-    for pattern in remove_case_insensitive:
-        name = re.sub(pattern, "", name, flags=re.IGNORECASE)
+    for pattern in crypto_removal_patterns:
+        name = pattern.sub("", name)
 
     name = name.lower()
 
@@ -98,11 +116,156 @@ def get_commodity_basename_or_ticker(full_name):
     name = full_name.lower()
     return name
 
+def get_basenames(names, asset_type):
+    # whole-column version of the get_*_basename_or_ticker functions (asset_type "stock", "etf", "crypto" or "commodity"): 
+    # every unique name is preprocessed once, names: pd.Series (returns pd.Series with the same index) or any list-like (returns list)
+    basename_funcs = {"stock": get_stock_basename_or_ticker, "etf": get_etf_basename_or_ticker, "crypto": get_crypto_basename_or_ticker, "commodity": get_commodity_basename_or_ticker}
+    basename_func = basename_funcs[asset_type]
+    unique_basenames = {name: basename_func(name) for name in dict.fromkeys(names)}
+    if isinstance(names, pd.Series):
+        return names.map(unique_basenames)
+    return [unique_basenames[name] for name in names]
+
+### CANDIDATE INDEX ###
+
+jaro_winkler_prefix_weight = 0.2 # prefix_weight of all Jaro-Winkler rounds (single-query and batch matching), high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
+
+class JaroWinklerIndex:
+    """
+    Blocking index for Jaro-Winkler rounds (rf.process.extractOne with JaroWinkler.normalized_similarity and a score_cutoff) over a candidates dict.
+    Narrows a query to the candidates which can reach the cutoff at all (first characters, length bands, character counts), the survivors are then scored exactly as before.
+    Lossless: with m matching characters (m <= common characters <= shorter length) the Jaro similarity is at most (m / len(a) + m / len(b) + 1) / 3 and a common prefix 
+    of k characters (k <= 4) adds at most k * prefix_weight * (1 - Jaro). Length bands use m = shorter length: a candidate with common prefix k can only reach the cutoff if
+    shorter / longer length >= 3 * (cutoff - k * prefix_weight) / (1 - k * prefix_weight) - 2. Candidates keep their dict order, so ties are resolved as with the full scan.
+    """
+    max_prefix_len = 4 # (Jaro-Winkler prefix length is capped at 4)
+
+    def __init__(self, candidates_dict, score_cutoff, prefix_weight):
+        self.keys = [k for k, v in candidates_dict.items() if v is not None] # (extractOne skips None choices)
+        self.choices = [candidates_dict[k] for k in self.keys]
+        self.score_cutoff = score_cutoff # lowest cutoff the index can be used with
+        self.prefix_weight = prefix_weight
+        self.lengths = np.array([len(c) for c in self.choices], dtype=np.int64)
+        # length band lookup (positions sorted by length)
+        self.length_order = np.argsort(self.lengths, kind="stable")
+        self.sorted_lengths = self.lengths[self.length_order]
+        # prefix buckets: prefix_buckets[k][prefix] = positions of the candidates starting with this k-character prefix (in dict order)
+        self.prefix_buckets = {k: {} for k in range(1, self.max_prefix_len + 1)}
+        for i, c in enumerate(self.choices):
+            for k in range(1, min(len(c), self.max_prefix_len) + 1):
+                self.prefix_buckets[k].setdefault(c[:k], []).append(i)
+        self.prefix_buckets = {k: {prefix: np.array(pos, dtype=np.int64) for prefix, pos in buckets.items()} for k, buckets in self.prefix_buckets.items()}
+        # character counts per candidate (n_candidates x n_distinct_characters)
+        self.char_idx = {ch: i for i, ch in enumerate(sorted(set("".join(self.choices))))}
+        self.char_counts = np.zeros((len(self.choices), len(self.char_idx)), dtype=np.uint16)
+        for i, c in enumerate(self.choices):
+            for ch in c:
+                self.char_counts[i, self.char_idx[ch]] += 1
+        # minimum length ratio per common prefix length (small slack against floating point rounding of the scores)
+        self.min_length_ratios = [3 * (score_cutoff - k * prefix_weight) / (1 - k * prefix_weight) - 2 - 1e-9 for k in range(self.max_prefix_len + 1)]
+
+    def get_candidate_positions(self, query):
+        # sorted positions (dict order) of all candidates which can reach score_cutoff for this query
+        n = len(query)
+        if n == 0:
+            return np.arange(len(self.choices)) # (two empty strings have a similarity of 1)
+        # 1. length bands
+        # no common prefix needed: length band around the query length
+        r = self.min_length_ratios[0]
+        if r <= 0:
+            positions = [np.arange(len(self.choices))]
+        else:
+            lo = np.searchsorted(self.sorted_lengths, np.ceil(r * n), side="left")
+            hi = np.searchsorted(self.sorted_lengths, np.floor(n / r), side="right")
+            positions = [self.length_order[lo:hi]]
+        # common prefix of (at least) k characters: wider length bands
+        prefix_buckets = []
+        for k in range(1, min(n, self.max_prefix_len) + 1):
+            bucket = self.prefix_buckets[k].get(query[:k])
+            if bucket is None:
+                break # no candidates with longer common prefixes either
+            prefix_buckets.append(bucket)
+            lengths = self.lengths[bucket]
+            ratios = np.minimum(lengths, n) / np.maximum(lengths, n)
+            positions.append(bucket[ratios >= self.min_length_ratios[k]])
+        positions = np.unique(np.concatenate(positions))
+
+        # 2. character count bound (with the common prefix length of every remaining candidate)
+        prefix_lens = np.zeros(len(positions), dtype=np.int64)
+        for k, bucket in enumerate(prefix_buckets, start=1):
+            prefix_lens[np.isin(positions, bucket, assume_unique=True)] = k
+        query_counts = np.zeros(len(self.char_idx), dtype=np.uint16)
+        for ch in query:
+            if ch in self.char_idx: # (characters which no candidate contains cannot match)
+                query_counts[self.char_idx[ch]] += 1
+        lengths = self.lengths[positions]
+        n_common = np.minimum(self.char_counts[positions], query_counts).sum(axis=1)
+        max_matches = np.minimum(n_common, np.minimum(lengths, n))
+        max_jaro = (max_matches / n + max_matches / np.maximum(lengths, 1) + 1) / 3
+        max_score = max_jaro + prefix_lens * self.prefix_weight * (1 - max_jaro)
+        return positions[max_score >= self.score_cutoff - 1e-9]
+
+    def extract_one(self, query, score_cutoff=None):
+        # same result as rf.process.extractOne(query, candidates_dict, scorer=rf.distance.JaroWinkler.normalized_similarity, processor=None, 
+        #                                       score_cutoff=score_cutoff, scorer_kwargs={"prefix_weight": prefix_weight}), i.e. (matched name, score, matched key) or None
+        score_cutoff = self.score_cutoff if score_cutoff is None else score_cutoff
+        if score_cutoff < self.score_cutoff:
+            raise ValueError(f"JaroWinklerIndex: Index was built for score_cutoff >= {self.score_cutoff}, got {score_cutoff}.")
+        positions = self.get_candidate_positions(query)
+        result = rf.process.extractOne(query=query,
+                                       choices=[self.choices[i] for i in positions],
+                                       scorer=rf.distance.JaroWinkler.normalized_similarity,
+                                       processor=None,
+                                       score_cutoff=score_cutoff,
+                                       scorer_kwargs={"prefix_weight": self.prefix_weight})
+        if result is None:
+            return None
+        return (result[0], result[1], self.keys[positions[result[2]]])
+
+def verify_jaro_winkler_index(index, queries, score_cutoff=None):
+    # checks that the index returns the same results as the full scan for all queries, returns (list of (query, full scan result, index result) mismatches, pruning stats dict)
+    score_cutoff = index.score_cutoff if score_cutoff is None else score_cutoff
+    candidates_dict = dict(zip(index.keys, index.choices))
+    mismatches, n_scored = [], 0
+    for q in queries:
+        full = rf.process.extractOne(query=q, choices=candidates_dict, scorer=rf.distance.JaroWinkler.normalized_similarity, processor=None, 
+                                     score_cutoff=score_cutoff, scorer_kwargs={"prefix_weight": index.prefix_weight})
+        indexed = index.extract_one(q, score_cutoff=score_cutoff)
+        if full != indexed:
+            mismatches.append((q, full, indexed))
+        n_scored += len(index.get_candidate_positions(q))
+    stats = {"n_queries": len(queries), "n_candidates": len(index.choices), "avg_candidates_scored": n_scored / max(len(queries), 1)}
+    return mismatches, stats
+
+def build_jaro_winkler_indexes(candidate_dicts, prefix_weight=jaro_winkler_prefix_weight):
+    # indexes for the large candidate dicts of the Jaro-Winkler rounds in match_stock() and match_crypto() (candidate_dicts: output of load_candidate_dicts()), 
+    # pass as jw_indexes, e.g. match_stock(query, **candidate_dicts["stocks"], jw_indexes=jw_indexes["stocks"])
+    return {"stocks": {"candidates_dict_all": JaroWinklerIndex(candidate_dicts["stocks"]["candidates_dict_all"], score_cutoff=0.94, prefix_weight=prefix_weight)},
+            "cryptos": {"candidates_dict_listed": JaroWinklerIndex(candidate_dicts["cryptos"]["candidates_dict_listed"], score_cutoff=0.95, prefix_weight=prefix_weight),
+                        "candidates_dict_all": JaroWinklerIndex(candidate_dicts["cryptos"]["candidates_dict_all"], score_cutoff=0.94, prefix_weight=prefix_weight)},
+            }
+
+def _jaro_winkler_extract_one(query, candidates_dict, score_cutoff, jw_index=None):
+    # Jaro-Winkler round of the matching functions (via the blocking index if given, which has to be built on the same candidates dict)
+    if jw_index is not None:
+        if jw_index.prefix_weight != jaro_winkler_prefix_weight:
+            raise ValueError(f"_jaro_winkler_extract_one(): Index was built with prefix_weight {jw_index.prefix_weight}, the matching functions use {jaro_winkler_prefix_weight}.")
+        return jw_index.extract_one(query, score_cutoff=score_cutoff)
+    return rf.process.extractOne(query=query,
+                                 choices=candidates_dict,
+                                 scorer=rf.distance.JaroWinkler.normalized_similarity,
+                                 processor=None,
+                                 score_cutoff=score_cutoff,
+                                 score_hint=None, 
+                                 scorer_kwargs={"prefix_weight": jaro_winkler_prefix_weight}
+                                 )
+
 ### MATCHING UTILITIES ###
 
-def match_stock(query, candidates_dict_all):
+def match_stock(query, candidates_dict_all, jw_indexes=None):
     # query: stock name string, to be matched to one of candidates
     # candidates_dict: dict with tickers as keys and preprocessed (!) names as values
+    # jw_indexes: optional JaroWinklerIndex for candidates_dict_all (see build_jaro_winkler_indexes()), same results but faster
 
 
     # IMPORTANT: 
@@ -137,14 +300,10 @@ def match_stock(query, candidates_dict_all):
         return match_info
 
     # 3. Try fuzzy matching using Jaro-Winkler distance
-    result = rf.process.extractOne(query=query_basename, # preprocessed query!
-                                  choices=candidates_dict_all, # 
-                                  scorer=rf.distance.JaroWinkler.normalized_similarity,
-                                  processor=None,
-                                  score_cutoff=0.94, # 0.94 has proven to be a good threshold for stocks
-                                  score_hint=None, 
-                                  scorer_kwargs={"prefix_weight": 0.2} # high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
-                                  )
+    result = _jaro_winkler_extract_one(query_basename, # preprocessed query!
+                                       candidates_dict_all, 
+                                       score_cutoff=0.94, # 0.94 has proven to be a good threshold for stocks
+                                       jw_index=(jw_indexes or {}).get("candidates_dict_all"))
     if result is not None: # tuple of (matched basename, score, matched ticker)
         match_info["matched_ticker"] = result[2]
         match_info["match_score"] = result[1]
@@ -164,6 +323,14 @@ def match_stock(query, candidates_dict_all):
     return match_info
 
 
+def _etf_sp500_adjustment(query_basename):
+    # variants of sp500 (except short/leveraged ETFs) are all mapped to "s&p500", which matches SPY via the manual matching dict
+    sp500_strings = ["sp500", "s&p500", "s&p 500", "sp 500", "s&p", "s and p", "s and p 500"]
+    avoid_strings = ["short", "bear", "inverse", "2x", "3x"]
+    if any(s in query_basename for s in sp500_strings) and (not any(s in query_basename for s in avoid_strings)):
+        return "s&p500"
+    return query_basename
+
 def match_etf(query, candidates_dict_all, candidates_dict_listed=None):
     # if candidates_dict_listed is provided we perform a multi-step matching process (only listed etfs first, then also include delisted)
 
@@ -187,10 +354,7 @@ def match_etf(query, candidates_dict_all, candidates_dict_listed=None):
     match_info["query_basename"] = query_basename
     # 2. Try manual matches
     # special adjustment since variants of sp500 are super common
-    sp500_strings = ["sp500", "s&p500", "s&p 500", "sp 500", "s&p", "s and p", "s and p 500"]
-    avoid_strings = ["short", "bear", "inverse", "2x", "3x"]
-    if any(s in query_basename for s in sp500_strings) and (not any(s in query_basename for s in avoid_strings)):
-        query_basename = "s&p500" # matches SPY via manual matching dict
+    query_basename = _etf_sp500_adjustment(query_basename)
     # manual matching
     if query_basename in manual_etf_match_dict:
         match_info["matched_ticker"] = manual_etf_match_dict[query_basename]
@@ -232,8 +396,10 @@ def match_etf(query, candidates_dict_all, candidates_dict_listed=None):
     return match_info
 
 
-def match_crypto(query, candidates_dict_all, candidates_dict_top200=None, candidates_dict_listed=None):
+def match_crypto(query, candidates_dict_all, candidates_dict_top200=None, candidates_dict_listed=None, jw_indexes=None):
     # if candidates_dict_listed is provided we perform a multi-step matching process (only listed cryptos first, then also include delisted)
+    # jw_indexes: optional JaroWinklerIndexes for candidates_dict_listed/candidates_dict_all (see build_jaro_winkler_indexes()), same results but faster
+    jw_indexes = jw_indexes or {}
 
     match_info = {"query": query, 
                   "query_basename": None, # only not None if preprocessing was applied
@@ -267,7 +433,7 @@ def match_crypto(query, candidates_dict_all, candidates_dict_top200=None, candid
                                     processor=None,
                                     score_cutoff=0.95,
                                     score_hint=None, 
-                                    scorer_kwargs={"prefix_weight": 0.2} # high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
+                                    scorer_kwargs={"prefix_weight": jaro_winkler_prefix_weight}
                                     )
         if result is not None:
             match_info["matched_ticker"] = result[2]
@@ -277,14 +443,7 @@ def match_crypto(query, candidates_dict_all, candidates_dict_top200=None, candid
     
     # 4. Try fuzzy matching using Jaro-Winkler (listed)
     if candidates_dict_listed is not None:
-        result = rf.process.extractOne(query=query_basename,
-                                    choices=candidates_dict_listed,
-                                    scorer=rf.distance.JaroWinkler.normalized_similarity,
-                                    processor=None,
-                                    score_cutoff=0.95,
-                                    score_hint=None, 
-                                    scorer_kwargs={"prefix_weight": 0.2} # high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
-                                    )
+        result = _jaro_winkler_extract_one(query_basename, candidates_dict_listed, score_cutoff=0.95, jw_index=jw_indexes.get("candidates_dict_listed"))
         if result is not None:
             match_info["matched_ticker"] = result[2]
             match_info["match_score"] = result[1]
@@ -292,14 +451,7 @@ def match_crypto(query, candidates_dict_all, candidates_dict_top200=None, candid
             return match_info
     
     # 5. Try fuzzy matching using Jaro-Winkler (all)
-    result = rf.process.extractOne(query=query_basename,
-                                choices=candidates_dict_all,
-                                scorer=rf.distance.JaroWinkler.normalized_similarity,
-                                processor=None,
-                                score_cutoff=0.94, # slightly lower threshold
-                                score_hint=None, 
-                                scorer_kwargs={"prefix_weight": 0.2} # high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
-                                )
+    result = _jaro_winkler_extract_one(query_basename, candidates_dict_all, score_cutoff=0.94, jw_index=jw_indexes.get("candidates_dict_all")) # slightly lower threshold
     if result is not None:
         match_info["matched_ticker"] = result[2]
         match_info["match_score"] = result[1]
@@ -356,7 +508,7 @@ def match_commodity(query, candidates_dict_all):
                                 processor=None,
                                 score_cutoff=0.95,
                                 score_hint=None, 
-                                scorer_kwargs={"prefix_weight": 0.2} # high weight of 0.2 (max is 0.25) to prefer matches with same (4-letter-)prefix strongly
+                                scorer_kwargs={"prefix_weight": jaro_winkler_prefix_weight}
                                 )
     if result is not None:
         match_info["matched_ticker"] = result[2]
@@ -399,15 +551,157 @@ def match_commodity(query, candidates_dict_all):
 
 
 
+### BATCH MATCHING ###
+# same cascades, thresholds and match_info outputs as the match_* functions above, but for many queries at once:
+# queries are deduplicated and every fuzzy round scores all remaining (unmatched) queries against the candidates with one rf.process.cdist call (multi-threaded)
+
+def _empty_match_info(query):
+    return {"query": query, 
+            "query_basename": None, # only not None if preprocessing was applied
+            "matched_ticker": None, 
+            "match_score": None, # fuzzy match score, if used
+            "match_type": None, # which matching round was successful?
+            }
+
+def batch_extract_one(queries, candidates_dict, scorer, score_cutoff, scorer_kwargs=None, chunk_size=256, workers=-1):
+    # equivalent of [rf.process.extractOne(q, candidates_dict, scorer=scorer, processor=None, score_cutoff=score_cutoff, scorer_kwargs=scorer_kwargs) for q in queries]
+    # (same scores, ties resolved in favor of the first candidate in dict order), queries are scored in chunks of chunk_size to limit the size of the score matrix
+    keys = [k for k, v in candidates_dict.items() if v is not None] # (extractOne skips None choices)
+    choices = [candidates_dict[k] for k in keys]
+    results = []
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start+chunk_size]
+        if len(choices) == 0:
+            results.extend([None] * len(chunk))
+            continue
+        scores = rf.process.cdist(chunk, choices, scorer=scorer, processor=None, score_cutoff=score_cutoff, dtype=np.float64, workers=workers, scorer_kwargs=scorer_kwargs)
+        best_idx = scores.argmax(axis=1) # first maximum
+        best_scores = scores[np.arange(len(chunk)), best_idx]
+        for i, score in zip(best_idx, best_scores):
+            results.append((choices[i], float(score), keys[i]) if score >= score_cutoff else None) # (scores below the cutoff are set to 0 by cdist)
+    return results
+
+def _run_match_cascade(queries, rounds, chunk_size=256, workers=-1):
+    # rounds: list of steps, applied in order to the queries without a match so far:
+    #   ("exact", ticker_func, match_type): ticker_func(query) returns the matched ticker or None
+    #   ("preprocess", basename_func, adjust_func): sets query_basename = basename_func(query), fuzzy/manual rounds use adjust_func(query_basename) (if not None)
+    #   ("manual", match_dict, match_type): exact lookup of the (adjusted) basename
+    #   ("fuzzy", candidates_dict, scorer, score_cutoff, scorer_kwargs, match_type): skipped if candidates_dict is None
+    match_infos = {q: _empty_match_info(q) for q in dict.fromkeys(queries)} # deduplicated, in order of first occurrence
+    remaining = list(match_infos.keys())
+    match_basenames = {}
+    for step in rounds:
+        if len(remaining) == 0:
+            break
+        kind = step[0]
+        if kind == "preprocess":
+            _, basename_func, adjust_func = step
+            for q in remaining:
+                match_infos[q]["query_basename"] = basename_func(q)
+                match_basenames[q] = adjust_func(match_infos[q]["query_basename"]) if adjust_func is not None else match_infos[q]["query_basename"]
+            continue
+        matched = set()
+        if kind == "exact":
+            _, ticker_func, match_type = step
+            for q in remaining:
+                ticker = ticker_func(q)
+                if ticker is not None:
+                    match_infos[q].update(matched_ticker=ticker, match_type=match_type)
+                    matched.add(q)
+        elif kind == "manual":
+            _, match_dict, match_type = step
+            for q in remaining:
+                if match_basenames[q] in match_dict:
+                    match_infos[q].update(matched_ticker=match_dict[match_basenames[q]], match_type=match_type)
+                    matched.add(q)
+        elif kind == "fuzzy":
+            _, candidates_dict, scorer, score_cutoff, scorer_kwargs, match_type = step
+            if candidates_dict is None:
+                continue
+            basenames = list(dict.fromkeys(match_basenames[q] for q in remaining)) # different queries can share a basename
+            results = dict(zip(basenames, batch_extract_one(basenames, candidates_dict, scorer, score_cutoff, scorer_kwargs=scorer_kwargs, chunk_size=chunk_size, workers=workers)))
+            for q in remaining:
+                result = results[match_basenames[q]]
+                if result is not None: # tuple of (matched basename, score, matched ticker)
+                    match_infos[q].update(matched_ticker=result[2], match_score=result[1], match_type=match_type)
+                    matched.add(q)
+        else:
+            raise ValueError(f"Unknown matching round type: {kind}")
+        remaining = [q for q in remaining if q not in matched]
+    return match_infos
+
+def _get_match_rounds(asset_type, candidates_dict_all, candidates_dict_listed=None, candidates_dict_top200=None):
+    # matching rounds of match_stock(), match_etf(), match_crypto() and match_commodity() in the format of _run_match_cascade()
+    jw, lev, wratio = rf.distance.JaroWinkler.normalized_similarity, rf.distance.Levenshtein.normalized_similarity, rf.fuzz.WRatio
+    jw_kwargs = {"prefix_weight": jaro_winkler_prefix_weight}
+    if asset_type == "stock":
+        return [("exact", lambda q: q.upper() if could_be_ticker(q) and q.upper() in candidates_dict_all else None, "round 1 (exact ticker match)"),
+                ("preprocess", get_stock_basename_or_ticker, None),
+                ("manual", manual_stock_match_dict, "round 2 (manual match dict)"),
+                ("fuzzy", candidates_dict_all, jw, 0.94, jw_kwargs, "round 3 (Jaro-Winkler matching)"),
+                ("exact", lambda q: q.upper() if could_be_ticker(q.upper()) and q.upper() in candidates_dict_all else None, "round 4 (exact ticker match, miscapitalized)")]
+    elif asset_type == "etf":
+        return [("exact", lambda q: q.upper() if could_be_ticker(q.upper()) and q.upper() in candidates_dict_all else None, "round 1 (exact ticker match)"),
+                ("preprocess", get_etf_basename_or_ticker, _etf_sp500_adjustment),
+                ("manual", manual_etf_match_dict, "round 2 (manual match dict)"),
+                ("fuzzy", candidates_dict_listed, wratio, 89, None, "round 3 (strict WRatio matching, listed only)"),
+                ("fuzzy", candidates_dict_all, wratio, 86, None, "round 4 (less strict WRatio matching, incl delisted)")]
+    elif asset_type == "crypto":
+        return [("exact", lambda q: q.upper() if len(q) <= 4 and q.upper() in candidates_dict_all else None, "round 1 (exact ticker match)"),
+                ("preprocess", get_crypto_basename_or_ticker, None),
+                ("manual", manual_crypto_match_dict, "round 2 (manual match dict)"),
+                ("fuzzy", candidates_dict_top200, jw, 0.95, jw_kwargs, "round 3 (Jaro-Winkler matching, top200 only)"),
+                ("fuzzy", candidates_dict_listed, jw, 0.95, jw_kwargs, "round 4 (Jaro-Winkler matching, listed only)"),
+                ("fuzzy", candidates_dict_all, jw, 0.94, jw_kwargs, "round 5 (Jaro-Winkler matching, incl delisted)"),
+                ("fuzzy", candidates_dict_all, lev, 0.9, None, "round 6 (Levenshtein matching, all)"),
+                ("exact", lambda q: q.upper() if q.upper() in candidates_dict_all else None, "round 7 (exact ticker match, long name)")]
+    elif asset_type == "commodity":
+        return [("preprocess", lambda q: q.lower(), None),
+                ("manual", manual_commodity_match_dict, "round 1 (manual match dict)"),
+                ("fuzzy", candidates_dict_all, jw, 0.95, jw_kwargs, "round 2 (Jaro-Winkler matching)"),
+                ("fuzzy", candidates_dict_all, lev, 0.85, None, "round 3 (Levenshtein matching)"),
+                ("fuzzy", candidates_dict_all, wratio, 89, None, "round 4 (WRatio matching)")]
+    raise ValueError(f"Unknown asset type: {asset_type}")
+
+def match_batch(queries, asset_type, candidates_dict_all, candidates_dict_listed=None, candidates_dict_top200=None, chunk_size=256, workers=-1):
+    # batch version of match_stock/match_etf/match_crypto/match_commodity (asset_type "stock", "etf", "crypto" or "commodity")
+    # candidate dicts as for the single-query functions, e.g. match_batch(queries, "etf", **load_candidate_dicts()["etfs"])
+    # returns dict query -> match_info (one entry per unique query, copy the dicts if they are modified or attached to several labels)
+    rounds = _get_match_rounds(asset_type, candidates_dict_all, candidates_dict_listed=candidates_dict_listed, candidates_dict_top200=candidates_dict_top200)
+    return _run_match_cascade(list(queries), rounds, chunk_size=chunk_size, workers=workers)
+
 ### PREP & APPLICATION ###
 
-def load_candidate_dicts():
+names_and_tickers_files = ["eodhd_stocks.csv", "eodhd_etfs.csv", "eodhd_cryptos.csv", "yahoo_eodhd_commodities.csv"]
+
+def load_candidate_dicts(path="../data/asset_data/names_and_tickers", cache_path=None):
     # load names and tickers data and create candidate dicts required by the matching functions
     #   - with appropriate sorting
     #   - with preprocessing applied
-
+    # cache_path: optional pickle file with the built candidate dicts, keyed on the hashes of the names and tickers csvs and of this module's source (preprocessing code),
+    #             rebuilt (and saved) only if any of them changed
+    if cache_path is None:
+        return _build_candidate_dicts(path)
+    
+    hasher = hashlib.sha256()
+    for file_path in [os.path.join(path, f) for f in names_and_tickers_files] + [__file__]:
+        with open(file_path, "rb") as f:
+            hasher.update(hashlib.sha256(f.read()).digest())
+    version = hasher.hexdigest()
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["version"] == version:
+            return cached["candidate_dicts"]
+        print("load_candidate_dicts(): Names and tickers data or preprocessing changed, rebuilding candidate dicts.")
+    candidate_dicts = _build_candidate_dicts(path)
+    with open(cache_path + ".tmp", "wb") as f:
+        pickle.dump({"version": version, "candidate_dicts": candidate_dicts}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_path + ".tmp", cache_path)
+    return candidate_dicts
+
+def _build_candidate_dicts(path):
     # load names and tickers data
-    path = "../data/asset_data/names_and_tickers"
     stocks = pd.read_csv(f"{path}/eodhd_stocks.csv", sep=";")
     etfs = pd.read_csv(f"{path}/eodhd_etfs.csv", sep=";")
     cryptos = pd.read_csv(f"{path}/eodhd_cryptos.csv", sep=";")
@@ -421,22 +715,25 @@ def load_candidate_dicts():
 
     # stocks
     stocks = stocks.sort_values(by=["in_sp500_as_of_may_2024", "delisted_as_of_may_2024"], ascending=[False, True])
-    stocks_candidates = dict(zip(stocks["Code"], stocks["Name"].apply(get_stock_basename_or_ticker)))
+    stocks_candidates = dict(zip(stocks["Code"], get_basenames(stocks["Name"], "stock")))
 
     # etfs
     etfs = etfs.sort_values(by=["delisted_as_of_may_2024"], ascending=[True]) # listed etfs first
-    etfs_candidates_all = dict(zip(etfs["Code"], etfs["Name"].apply(get_etf_basename_or_ticker)))
-    etfs_candidates_listed = {t:n for t, n in etfs_candidates_all.items() if t in etfs[~etfs["delisted_as_of_may_2024"]]["Code"].values}
+    etfs_candidates_all = dict(zip(etfs["Code"], get_basenames(etfs["Name"], "etf")))
+    etfs_listed_codes = set(etfs.loc[~etfs["delisted_as_of_may_2024"], "Code"])
+    etfs_candidates_listed = {t:n for t, n in etfs_candidates_all.items() if t in etfs_listed_codes}
 
     # cryptos
     cryptos = cryptos.sort_values(["in_top200_as_of_dec_2022", "delisted_as_of_may_2024"], ascending=[False, True])
-    cryptos_candidates_all = dict(zip(cryptos["Code_clean"], cryptos["Name"].apply(get_crypto_basename_or_ticker)))
-    cryptos_candidates_top200 = {t:n for t, n in cryptos_candidates_all.items() if t in cryptos[cryptos["in_top200_as_of_dec_2022"]]["Code_clean"].values}
-    cryptos_candidates_listed = {t:n for t, n in cryptos_candidates_all.items() if t not in cryptos[cryptos["delisted_as_of_may_2024"]]["Code_clean"].values}
+    cryptos_candidates_all = dict(zip(cryptos["Code_clean"], get_basenames(cryptos["Name"], "crypto")))
+    cryptos_top200_codes = set(cryptos.loc[cryptos["in_top200_as_of_dec_2022"], "Code_clean"])
+    cryptos_delisted_codes = set(cryptos.loc[cryptos["delisted_as_of_may_2024"], "Code_clean"])
+    cryptos_candidates_top200 = {t:n for t, n in cryptos_candidates_all.items() if t in cryptos_top200_codes}
+    cryptos_candidates_listed = {t:n for t, n in cryptos_candidates_all.items() if t not in cryptos_delisted_codes}
     
     # commodities
     # no sorting needed
-    commodities_candidates_all = dict(zip(commodities["Code"], commodities["Name"].apply(get_commodity_basename_or_ticker)))
+    commodities_candidates_all = dict(zip(commodities["Code"], get_basenames(commodities["Name"], "commodity")))
     
     # return in a dict
     return_dict = {"stocks": {"candidates_dict_all": stocks_candidates},
@@ -446,14 +743,186 @@ def load_candidate_dicts():
                     }                
     return return_dict
 
-"""
-def get_matches(output_jsons, names_and_tickers_dfs):
-    
-    # prepare candidate dicts for each asset type
-    stock_candidates_dict = 
-
-    return outputs_with_matches
-"""
+class MatchCache:
+    """
+    Persistent cache (json file) of match_info results in front of the matching functions, keyed by asset type and raw query.
+    Every asset type has a version hash of its candidate dicts (names and tickers data after preprocessing, incl. order), its manual match dict and this module's source 
+    (matching rounds, thresholds, preprocessing), cached results of an asset type are dropped automatically when its version changes.
+    """
+    asset_type_keys = {"stock": "stocks", "etf": "etfs", "crypto": "cryptos", "commodity": "commodities"} # asset type -> key in load_candidate_dicts() output
+
+    def __init__(self, cache_path, candidate_dicts=None):
+        self.cache_path = cache_path
+        self.candidate_dicts = candidate_dicts if candidate_dicts is not None else load_candidate_dicts()
+        with open(__file__, "rb") as f:
+            self.source_hash = hashlib.sha256(f.read()).hexdigest() # any change of the matching code invalidates all cached results
+        self.versions = {asset_type: self._get_version(asset_type) for asset_type in self.asset_type_keys}
+        self.matches = {asset_type: {} for asset_type in self.asset_type_keys} # asset_type -> query -> match_info
+        self.hits = {asset_type: 0 for asset_type in self.asset_type_keys}
+        self.misses = {asset_type: 0 for asset_type in self.asset_type_keys}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                cached = json.load(f)
+            for asset_type, entry in cached.items():
+                if asset_type in self.versions and entry["version"] == self.versions[asset_type]:
+                    self.matches[asset_type] = entry["matches"]
+                else:
+                    print(f"MatchCache: Candidates, manual matches or matching code for asset type {asset_type} changed, dropping {len(entry['matches'])} cached matches.")
+
+    def _get_version(self, asset_type):
+        manual_match_dicts = {"stock": manual_stock_match_dict, "etf": manual_etf_match_dict, "crypto": manual_crypto_match_dict, "commodity": manual_commodity_match_dict}
+        content = json.dumps([self.candidate_dicts[self.asset_type_keys[asset_type]], manual_match_dicts[asset_type], self.source_hash], default=str)
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    def match(self, query, asset_type):
+        # returns match_info (copy) for a single query, see match_stock(), match_etf(), match_crypto() and match_commodity()
+        matches = self.matches[asset_type]
+        if query in matches:
+            self.hits[asset_type] += 1
+        else:
+            self.misses[asset_type] += 1
+            match_funcs = {"stock": match_stock, "etf": match_etf, "crypto": match_crypto, "commodity": match_commodity}
+            matches[query] = match_funcs[asset_type](query, **self.candidate_dicts[self.asset_type_keys[asset_type]])
+        return dict(matches[query])
+
+    def match_many(self, queries, asset_type, chunk_size=256, workers=-1):
+        # returns list of match_info dicts (copies) for the queries, cache misses are matched at once via match_batch()
+        matches = self.matches[asset_type]
+        missing = [q for q in dict.fromkeys(queries) if q not in matches]
+        if len(missing) > 0:
+            matches.update(match_batch(missing, asset_type, chunk_size=chunk_size, workers=workers, **self.candidate_dicts[self.asset_type_keys[asset_type]]))
+        self.misses[asset_type] += len(missing)
+        self.hits[asset_type] += len(queries) - len(missing) # repeated queries count as hits
+        return [dict(matches[q]) for q in queries]
+
+    def save(self):
+        cache = {asset_type: {"version": self.versions[asset_type], "matches": self.matches[asset_type]} for asset_type in self.asset_type_keys}
+        with open(self.cache_path + ".tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(self.cache_path + ".tmp", self.cache_path) # atomic, no half-written cache files
+
+    def get_stats(self):
+        # hits/misses/hit rate per asset type (since this object was created)
+        stats = pd.DataFrame({"hits": self.hits, "misses": self.misses, "cached_queries": {a: len(m) for a, m in self.matches.items()}})
+        stats.loc["total"] = stats.sum()
+        stats["hit_rate"] = stats["hits"] / (stats["hits"] + stats["misses"]).replace(0, float("nan"))
+        return stats
+
+### WHOLE-DATASET PIPELINE ###
+
+_worker_candidate_dicts = None # candidate dicts of a get_matches() worker process (set once per process by the pool initializer)
+
+def _init_match_worker(candidate_dicts):
+    global _worker_candidate_dicts
+    _worker_candidate_dicts = candidate_dicts
+
+def _match_worker(task):
+    # matches one batch of unique queries of one asset type (cdist single-threaded, parallelism comes from the worker processes)
+    asset_type, queries, chunk_size = task
+    return asset_type, match_batch(queries, asset_type, chunk_size=chunk_size, workers=1, **_worker_candidate_dicts[MatchCache.asset_type_keys[asset_type]])
+
+def _video_worker(extractions_all):
+    # video-level columns (see results_processing_inf.ipynb): deduplicated extractions (retaining/removing unmatched assets) and trade info with/without neutrals
+    def filter_for_trade_info(asset):
+        return {"asset_type": asset["asset_type"], "ticker": asset["match_info"]["matched_ticker"], "sentiment": asset["sentiment"]}
+    extractions_dedup = deduplicate_asset_list(json.loads(extractions_all), retain_unmatched=False)
+    return (json.dumps(deduplicate_asset_list(json.loads(extractions_all), retain_unmatched=True)),
+            json.dumps(extractions_dedup),
+            json.dumps([filter_for_trade_info(a) for a in extractions_dedup]),
+            json.dumps([filter_for_trade_info(a) for a in extractions_dedup if a["sentiment"] != "neutral"]))
+
+def get_matches(chunks_df, candidate_dicts=None, n_workers=None, queries_per_task=200, chunk_size=256, matched_chunks_path=None, videos_path=None):
+    # matching pipeline for the whole dataset (replaces the matching and chunk recombination loops in results_processing_inf.ipynb, same outputs)
+    # chunks_df: chunk-level df with columns "video_id", "chunk_number" and "label" (validated json outputs: list of assets with "asset_name", "asset_type", "sentiment")
+    # 1. unique asset names per asset type are matched in a process pool (batches of queries_per_task queries, see match_batch()), every worker gets the candidate dicts once
+    # 2. match_info dicts are added to every asset of types stock/etf/crypto/commodity (-> matched chunk-level df)
+    # 3. chunks are recombined to videos and deduplicated per video (deduplicate_asset_list(), also in the pool)
+    # n_workers: number of processes (None: all cores, 1: no pool)
+    # matched_chunks_path/videos_path: optional csv output paths
+    # returns (matched chunks df, video df, stats dict with throughput, hits per matching round and the time spent in the serial parts)
+    # known limit: only the matching and the deduplication run in the pool, label parsing, match_info attachment and the chunk recombination (groupby + json) 
+    #              run serially in this process (serial_time_s in the stats), which bounds the speedup from more workers
+    start_time = time.time()
+    candidate_dicts = candidate_dicts if candidate_dicts is not None else load_candidate_dicts()
+    n_workers = n_workers if n_workers is not None else os.cpu_count()
+
+    # unique queries per asset type
+    labels = [json.loads(label) for label in chunks_df["label"]]
+    parse_time = time.time() - start_time
+    queries = {asset_type: {} for asset_type in MatchCache.asset_type_keys}
+    for label in labels:
+        for asset in label:
+            if asset["asset_type"] in queries:
+                queries[asset["asset_type"]][asset["asset_name"]] = None
+    tasks = [(asset_type, list(q)[i:i+queries_per_task], chunk_size) for asset_type, q in queries.items() for i in range(0, len(q), queries_per_task)]
+
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_match_worker, initargs=(candidate_dicts,)) if n_workers > 1 else None
+    try:
+        # 1. matching
+        if pool is None:
+            _init_match_worker(candidate_dicts)
+            results = map(_match_worker, tasks)
+        else:
+            results = pool.map(_match_worker, tasks)
+        match_infos = {asset_type: {} for asset_type in queries}
+        for asset_type, batch_match_infos in results:
+            match_infos[asset_type].update(batch_match_infos)
+        match_time = time.time() - start_time
+
+        # 2. add match_info to every asset (copies, deduplication modifies them)
+        attach_start_time = time.time()
+        match_type_counts = {asset_type: {} for asset_type in queries}
+        for label in labels:
+            for asset in label:
+                if asset["asset_type"] in match_infos:
+                    asset["match_info"] = dict(match_infos[asset["asset_type"]][asset["asset_name"]])
+                    match_type = asset["match_info"]["match_type"] or "no match"
+                    match_type_counts[asset["asset_type"]][match_type] = match_type_counts[asset["asset_type"]].get(match_type, 0) + 1
+        matched_chunks_df = chunks_df.assign(label=[json.dumps(label) for label in labels])
+        attach_time = time.time() - attach_start_time
+
+        # 3. video-level df
+        video_start_time = time.time()
+        video_df = matched_chunks_df.sort_values(by=["video_id", "chunk_number"]).groupby(["video_id"]).agg({"label": lambda x: json.dumps([asset for chunk_list in x for asset in json.loads(chunk_list)])})
+        video_df = video_df.reset_index().rename(columns={"label": "extractions_all"})
+        recombine_time = time.time() - video_start_time
+        if pool is None:
+            video_cols = list(map(_video_worker, video_df["extractions_all"]))
+        else:
+            video_cols = list(pool.map(_video_worker, video_df["extractions_all"], chunksize=max(1, len(video_df) // (4 * n_workers))))
+        dedup_time = time.time() - video_start_time
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    video_col_names = ["extractions_dedup_retain_unmatched", "extractions_dedup", "trade_info_incl_neutrals", "trade_info_no_neutrals"]
+    for i, col in enumerate(video_col_names):
+        video_df[col] = [row[i] for row in video_cols]
+
+    # save
+    if matched_chunks_path is not None:
+        matched_chunks_df.to_csv(matched_chunks_path, sep=";", index=False)
+    if videos_path is not None:
+        video_df.to_csv(videos_path, sep=";", index=False)
+
+    # stats
+    n_extractions = sum(sum(counts.values()) for counts in match_type_counts.values())
+    n_unique_queries = sum(len(q) for q in queries.values())
+    stats = {"n_workers": n_workers, 
+             "n_chunks": len(chunks_df), 
+             "n_videos": len(video_df),
+             "n_extractions": n_extractions, # (matchable asset types only)
+             "n_unique_queries": {asset_type: len(q) for asset_type, q in queries.items()},
+             "match_time_s": match_time,
+             "dedup_time_s": dedup_time, # (incl. recombine_time_s)
+             "serial_time_s": {"parse_labels": parse_time, "attach_match_infos": attach_time, "recombine_chunks": recombine_time}, # parts not run in the pool
+             "total_time_s": time.time() - start_time,
+             "extractions_per_s": n_extractions / match_time if match_time > 0 else None,
+             "unique_queries_per_s": n_unique_queries / match_time if match_time > 0 else None,
+             "match_types": match_type_counts, # asset_type -> matching round (match_type) -> number of extractions
+             }
+    print(f"get_matches(): Matched {n_extractions} extractions ({n_unique_queries} unique names) in {match_time:.1f}s with {n_workers} worker(s), "
+          f"{len(video_df)} videos deduplicated in {dedup_time:.1f}s.")
+    return matched_chunks_df, video_df, stats
 
 #############################################################################################################################################
 
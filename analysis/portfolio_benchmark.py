@@ -0,0 +1,148 @@
+"""Offline benchmark for the portfolio computation (PortfolioBuilder, Portfolio and performance metrics) on synthetic data.
+
+Usage (from the analysis folder): python portfolio_benchmark.py --n_channels 50 --output benchmark.json
+"""
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import portfolio_utils as pfu
+
+asset_types = ["stock", "crypto", "etf", "commodity"]
+
+def make_synthetic_returns(n_assets=500, n_days=2013, start_date="2016-01-04", listing_frac=0.3, delisting_frac=0.2, seed=0):
+    # synthetic returns df in the same format as the real returns data: "YYYY-MM-DD" index (business days), columns f"{asset_type}+{ticker}" + benchmark columns
+    # listing_frac/delisting_frac: share of assets with returns starting later/ending earlier than the full period (NaN gaps at the start/end)
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start=start_date, periods=n_days).strftime("%Y-%m-%d")
+    returns = rng.normal(0.0004, 0.02, size=(n_days, n_assets))
+    # listing (NaN until first available day) and delisting (NaN after last available day)
+    listed = rng.random(n_assets) < listing_frac
+    delisted = rng.random(n_assets) < delisting_frac
+    first_day = np.where(listed, rng.integers(1, n_days // 2, n_assets), 0)
+    last_day = np.where(delisted, rng.integers(n_days // 2, n_days, n_assets), n_days)
+    day_idx = np.arange(n_days)[:, None]
+    returns[(day_idx <= first_day) | (day_idx >= last_day)] = np.nan
+    columns = [f"{asset_types[i % len(asset_types)]}+T{i}" for i in range(n_assets)]
+    returns_df = pd.DataFrame(returns, index=dates, columns=columns)
+    # benchmark columns (first day has no returns, as in the real data)
+    returns_df["benchmark+cash"] = np.r_[np.nan, np.zeros(n_days - 1)]
+    returns_df["benchmark+SPY"] = np.r_[np.nan, rng.normal(0.0004, 0.01, n_days - 1)]
+    returns_df["benchmark+3m_tbills"] = np.r_[np.nan, np.full(n_days - 1, 0.00005)]
+    return returns_df
+
+def make_synthetic_extractions(returns_df, n_channels=50, videos_per_channel=200, max_trades_per_video=4, buy_share=0.7, unknown_ticker_share=0.05, seed=0):
+    # synthetic extractions df (one row per video) with the columns used by PortfolioBuilder: video_id, upload_date ("YYYYMMDD"), channel_id, trade_info (json list)
+    # unknown_ticker_share: share of recommendations for tickers without returns data
+    rng = np.random.default_rng(seed)
+    tickers = [c.split("+", 1) for c in returns_df.columns if not c.startswith("benchmark")]
+    dates = pd.to_datetime(returns_df.index)
+    n_calendar_days = (dates[-1] - dates[0]).days
+    rows = []
+    for c in range(n_channels):
+        upload_dates = dates[0] + pd.to_timedelta(rng.integers(-30, n_calendar_days, videos_per_channel), unit="D")
+        for v, upload_date in enumerate(upload_dates):
+            trade_info = []
+            for _ in range(rng.integers(0, max_trades_per_video + 1)):
+                if rng.random() < unknown_ticker_share:
+                    asset_type, ticker = asset_types[rng.integers(len(asset_types))], f"UNKNOWN{rng.integers(100)}"
+                else:
+                    asset_type, ticker = tickers[rng.integers(len(tickers))]
+                trade_info.append({"asset_type": asset_type, "ticker": ticker, "sentiment": "buy" if rng.random() < buy_share else "sell"})
+            rows.append({"video_id": f"ch{c}_v{v}", "upload_date": upload_date.strftime("%Y%m%d"), "channel_id": f"ch{c}", "trade_info": json.dumps(trade_info)})
+    return pd.DataFrame(rows)
+
+def _run_phases(extractions_df, returns_df, settings, n_metric_channels, record, profiler=None):
+    # runs all benchmarked phases, record(phase, func) executes func and stores its measurements
+    builder = record("builder_init", lambda: pfu.PortfolioBuilder(extractions_df, returns_df, dict(settings)))
+    builder.profiler = profiler # breakdown of compute_portfolio into its internal phases
+    channel_ids = builder.ext["channel_id"].unique()
+    results = record("compute_portfolio", lambda: [builder.compute_portfolio(channel_id) for channel_id in channel_ids])
+    portfolios = record("portfolio_init", lambda: [pfu.Portfolio(*res, compute_settings=dict(settings), channel_id=channel_id) for channel_id, res in zip(channel_ids, results)])
+
+    # metrics (per Portfolio, as in portfolio_analysis.ipynb; the string index is needed for Portfolio._get_idx)
+    portfolios = [p for p in portfolios if p.has_trades][:n_metric_channels]
+    for p in portfolios:
+        for df in [p.pos_df_bt, p.pos_df_at]:
+            df.index = df.index.strftime("%Y-%m-%d")
+    portfolios = [pfu.Portfolio(p.pos_df_bt, p.pos_df_at, p.trade_logs_df, compute_settings=p.compute_settings, channel_id=p.channel_id) for p in portfolios]
+    spy_returns, tbill_returns = returns_df["benchmark+SPY"], returns_df["benchmark+3m_tbills"]
+    metrics = {"total_return": lambda p, period: p.get_total_return(period=period),
+               "total_excess_return": lambda p, period: p.get_total_excess_return(bm_returns=spy_returns, period=period),
+               "sharpe": lambda p, period: p.get_sharpe_ratio(bm_returns=tbill_returns, period=period),
+               "sortino": lambda p, period: p.get_sortino_ratio(bm_returns=tbill_returns, daily_target_return=0, period=period),
+               "value_at_risk": lambda p, period: p.get_value_at_risk(alpha=0.05, period=period),
+               "max_drawdown": lambda p, period: p.get_max_drawdown(period=period),
+               "beta": lambda p, period: p.get_beta(bm_returns=spy_returns, period=period)}
+    for name, metric in metrics.items():
+        record(f"metric_{name}", lambda: [metric(p, period) for p in portfolios for period in ["full", "active_period", "active_days"]])
+    record("portfolio_set_stats", lambda: pfu.PortfolioSet(portfolios).get_stats_df(spy_returns, tbill_returns, spy_returns))
+    return len(channel_ids), len(portfolios)
+
+def run_benchmark(n_assets=500, n_days=2013, n_channels=50, videos_per_channel=200, n_metric_channels=50, settings=None, measure_memory=True, seed=0, output_path=None):
+    # returns (and optionally saves as json) a dict with the benchmark config, per-phase wall times, the internal compute_portfolio phases (PhaseProfiler summary) 
+    # and (if measure_memory) per-phase peak memory (tracemalloc)
+    # memory is measured in a separate second pass, since tracemalloc slows down the timed code considerably
+    returns_df = make_synthetic_returns(n_assets=n_assets, n_days=n_days, seed=seed)
+    extractions_df = make_synthetic_extractions(returns_df, n_channels=n_channels, videos_per_channel=videos_per_channel, seed=seed)
+    if settings is None:
+        settings = {"pf_start_date": returns_df.index[0], "pf_end_date": returns_df.index[-1], "pf_initial_value": 1, "portfolio_type": "equal_weight",
+                    "max_positions": 10000, "max_holding_period": 252, "neutral_asset": "cash", "min_days_wait_after_upload": 1, "engine": "event_driven"}
+
+    phases = {}
+    def record_time(phase, func):
+        start_time = time.perf_counter()
+        res = func()
+        phases[phase] = {"wall_time_s": time.perf_counter() - start_time}
+        return res
+    profiler = pfu.PhaseProfiler()
+    n_channels_computed, n_metric_portfolios = _run_phases(extractions_df, returns_df, settings, n_metric_channels, record_time, profiler=profiler)
+
+    if measure_memory:
+        def record_memory(phase, func):
+            tracemalloc.start()
+            res = func()
+            phases[phase]["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            return res
+        _run_phases(extractions_df, returns_df, settings, n_metric_channels, record_memory)
+
+    results = {"config": {"n_assets": n_assets, "n_days": n_days, "n_channels": n_channels, "videos_per_channel": videos_per_channel,
+                          "n_metric_channels": n_metric_channels, "seed": seed, "settings": settings},
+               "environment": {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__, "machine": platform.machine()},
+               "n_channels_computed": n_channels_computed,
+               "n_metric_portfolios": n_metric_portfolios,
+               "phases": phases,
+               "compute_portfolio_phases": profiler.summary().to_dict(orient="index"),
+               "compute_portfolio_per_channel_s": phases["compute_portfolio"]["wall_time_s"] / max(n_channels_computed, 1)}
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=4)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the portfolio computation on synthetic data.")
+    parser.add_argument("--n_assets", type=int, default=500)
+    parser.add_argument("--n_days", type=int, default=2013)
+    parser.add_argument("--n_channels", type=int, default=50)
+    parser.add_argument("--videos_per_channel", type=int, default=200)
+    parser.add_argument("--n_metric_channels", type=int, default=50)
+    parser.add_argument("--engine", default="event_driven", choices=["event_driven", "daily_loop"])
+    parser.add_argument("--no_memory", action="store_true", help="skip the (slow) tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="path of the json output (printed if not given)")
+    args = parser.parse_args()
+
+    returns_index = pd.bdate_range(start="2016-01-04", periods=args.n_days).strftime("%Y-%m-%d")
+    settings = {"pf_start_date": returns_index[0], "pf_end_date": returns_index[-1], "pf_initial_value": 1, "portfolio_type": "equal_weight",
+                "max_positions": 10000, "max_holding_period": 252, "neutral_asset": "cash", "min_days_wait_after_upload": 1, "engine": args.engine}
+    results = run_benchmark(n_assets=args.n_assets, n_days=args.n_days, n_channels=args.n_channels, videos_per_channel=args.videos_per_channel,
+                            n_metric_channels=args.n_metric_channels, settings=settings, measure_memory=not args.no_memory, seed=args.seed, output_path=args.output)
+    if args.output is None:
+        print(json.dumps(results, indent=4))
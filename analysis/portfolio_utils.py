@@ -5,6 +5,16 @@ from scipy.stats import ttest_1samp
 import numpy as np
 import json
 import time
+import warnings
+import hashlib
+import itertools
+import os
+import zipfile
+import contextlib
+import tracemalloc
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 ### performance metrics (standalone functions, so we can also compute them for benchmarks etc.)
 def beta(pf_returns, bm_returns):
@@ -148,6 +158,615 @@ class Portfolio:
             idx = idx[1:]
         return idx
 
+class PortfolioSet:
+    """
+    Stacks the return series of many portfolios (e.g. all runs x channels) into one (days x portfolios) array aligned to a common trading calendar, 
+    with masks for the "full", "active_period" and "active_days" periods (same index selection as Portfolio._get_idx).
+    All performance metrics are then computed column-wise for all portfolios at once. Definitions are the same as for the standalone metric functions, 
+    results match the per-portfolio Portfolio.get_* methods up to floating point rounding.
+    """
+    periods = ["full", "active_period", "active_days"]
+
+    def __init__(self, portfolios, run_names=None):
+        # portfolios without executed trades are skipped (no returns to compute metrics on)
+        if run_names is None:
+            run_names = [None] * len(portfolios)
+        self.portfolios = [p for p in portfolios if p.has_trades]
+        self.run_names = [r for p, r in zip(portfolios, run_names) if p.has_trades]
+        if len(self.portfolios) == 0:
+            raise ValueError("PortfolioSet: No portfolios with executed trades.")
+
+        # common calendar: index of the first portfolio (all portfolios of our runs share the same observation period)
+        self.calendar = self.portfolios[0].pf_returns.index
+        self.returns = np.full((len(self.calendar), len(self.portfolios)), np.nan)
+        for j, p in enumerate(self.portfolios):
+            if p.pf_returns.index.equals(self.calendar):
+                self.returns[:, j] = p.pf_returns.to_numpy()
+            else:
+                self.returns[self._get_rows(p.pf_returns.index), j] = p.pf_returns.to_numpy()
+
+        # period masks (days x portfolios)
+        self.masks = {}
+        for period in self.periods:
+            mask = np.zeros(self.returns.shape, dtype=bool)
+            for j, p in enumerate(self.portfolios):
+                mask[self._get_rows(p._get_idx(period)), j] = True
+            self.masks[period] = mask
+
+    def _get_rows(self, idx):
+        rows = self.calendar.get_indexer(idx)
+        if (rows < 0).any():
+            raise ValueError("PortfolioSet: Portfolio index contains dates which are not in the common calendar.")
+        return rows
+
+    def _align(self, series):
+        # align a benchmark/target series to the calendar (label based, as .loc[idx] in the Portfolio methods) -> (days x 1) for broadcasting
+        return series.loc[self.calendar].to_numpy(dtype=np.float64)[:, None]
+
+    # column-wise metrics (return one value per portfolio)
+    def get_total_returns(self, period="full"):
+        return _masked_total_return(self.returns, self.masks[period])
+
+    def get_total_excess_returns(self, bm_returns, period="full"):
+        bm = np.broadcast_to(self._align(bm_returns), self.returns.shape)
+        return _masked_total_return(self.returns, self.masks[period]) - _masked_total_return(bm, self.masks[period])
+
+    def get_sharpe_ratios(self, bm_returns, period="full"):
+        mean, std = _masked_mean_std(self.returns - self._align(bm_returns), self.masks[period])
+        return mean / std
+
+    def get_sortino_ratios(self, bm_returns, daily_target_return=0, period="full"):
+        mask = self.masks[period]
+        excess_mean, _ = _masked_mean_std(self.returns - self._align(bm_returns), mask)
+        target = self._align(daily_target_return) if isinstance(daily_target_return, pd.Series) else daily_target_return
+        downside_returns = self.returns - target
+        downside_returns[downside_returns > 0] = 0
+        _, downside_std = _masked_mean_std(downside_returns, mask)
+        return excess_mean / downside_std
+
+    def get_values_at_risk(self, alpha, period="full"):
+        return -_masked_quantile(self.returns, self.masks[period], alpha)
+
+    def get_max_drawdowns(self, period="full"):
+        mask = self.masks[period]
+        valid = mask & ~np.isnan(self.returns)
+        # pf values over the period only (as (1 + r).cumprod() on the selected days), NaN outside of it
+        pf_values = np.where(valid, np.cumprod(np.where(valid, 1 + self.returns, 1.), axis=0), np.nan)
+        cum_max = np.fmax.accumulate(pf_values, axis=0)
+        drawdown = (cum_max - pf_values) / cum_max
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning) # all-NaN columns -> NaN
+            return np.nanmax(drawdown, axis=0)
+
+    def get_betas(self, bm_returns, period="full"):
+        mask = self.masks[period]
+        bm = np.broadcast_to(self._align(bm_returns), self.returns.shape)
+        # np.cov returns NaN if any value is NaN
+        has_nan = (mask & (np.isnan(self.returns) | np.isnan(bm))).any(axis=0)
+        n = mask.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pf_dev = np.where(mask, self.returns - np.where(mask, self.returns, 0.).sum(axis=0) / n, 0.)
+            bm_dev = np.where(mask, bm - np.where(mask, bm, 0.).sum(axis=0) / n, 0.)
+            beta = (pf_dev * bm_dev).sum(axis=0) / (bm_dev * bm_dev).sum(axis=0) # (n - 1) cancels out
+        return np.where(has_nan | (n < 2), np.nan, beta)
+
+    def get_stats_df(self, excess_bm_returns, rf_returns, beta_bm_returns, var_alpha=0.05, daily_target_return=0):
+        # tidy stats df with the same columns as portfolio_stats.csv (see portfolio_analysis.ipynb):
+        # total excess returns vs. excess_bm_returns (SPY), sharpe/sortino vs. rf_returns (3m t-bills), beta vs. beta_bm_returns (SPY)
+        rows = []
+        for p, run_name in zip(self.portfolios, self.run_names):
+            settings = p.compute_settings
+            rows.append({"channel_id": p.channel_id, 
+                         "run_name": run_name, 
+                         ### run settings
+                         "portfolio_type": settings["portfolio_type"],
+                         "max_positions": settings["max_positions"],
+                         "max_holding_period": settings["max_holding_period"],
+                         "neutral_asset": settings["neutral_asset"],
+                         "min_days_wait_after_upload": settings["min_days_wait_after_upload"],
+                         ### portfolio stats 
+                         "n_days_total_period": p.n_days_total_period,
+                         "n_days_active_holdings": p.n_days_active_holdings,
+                         "n_days_active_period": p.n_days_active_period,
+                         "n_buys": p.n_buys,
+                         "n_sells": p.n_sells,
+                         "n_unique_positions": p.n_unique_positions,
+                         "n_buys_stocks": p.n_buys_stocks,
+                         "n_buys_cryptos": p.n_buys_cryptos,
+                         "n_buys_etfs": p.n_buys_etfs,
+                         "n_buys_commodities": p.n_buys_commodities,
+                         })
+        stats_df = pd.DataFrame(rows)
+        # performance stats (column-wise for all portfolios)
+        performance_stats = {}
+        for period in self.periods:
+            performance_stats[f"total_return_{period}"] = self.get_total_returns(period=period)
+            performance_stats[f"total_excess_return_{period}"] = self.get_total_excess_returns(bm_returns=excess_bm_returns, period=period)
+            performance_stats[f"sharpe_{period}"] = self.get_sharpe_ratios(bm_returns=rf_returns, period=period)
+            performance_stats[f"sortino_{period}"] = self.get_sortino_ratios(bm_returns=rf_returns, daily_target_return=daily_target_return, period=period)
+            performance_stats[f"value_at_risk_{period}"] = self.get_values_at_risk(alpha=var_alpha, period=period)
+            performance_stats[f"max_drawdown_{period}"] = self.get_max_drawdowns(period=period)
+            performance_stats[f"beta_{period}"] = self.get_betas(bm_returns=beta_bm_returns, period=period)
+        return pd.concat([stats_df, pd.DataFrame(performance_stats)], axis=1)
+
+# masked column-wise helpers for PortfolioSet (NaN handling as in the pandas/numpy calls of the standalone metric functions)
+def _masked_total_return(returns, mask):
+    # (1 + r).prod() - 1, skipping NaN
+    return np.prod(np.where(mask & ~np.isnan(returns), 1 + returns, 1.), axis=0) - 1
+
+def _masked_mean_std(values, mask):
+    # pandas .mean() and .std() (ddof=1), skipping NaN
+    valid = mask & ~np.isnan(values)
+    n = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.).sum(axis=0) / n
+        var = (np.where(valid, values - mean, 0.) ** 2).sum(axis=0) / (n - 1)
+    return mean, np.where(n > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+def _masked_quantile(values, mask, q):
+    # np.quantile(..., method="linear") for each column (NaN if the column contains NaN within the mask)
+    has_nan = (mask & np.isnan(values)).any(axis=0)
+    n = mask.sum(axis=0)
+    sorted_values = np.sort(np.where(mask & ~np.isnan(values), values, np.inf), axis=0)
+    virtual_idx = (n - 1) * q
+    prev_idx = np.clip(np.floor(virtual_idx).astype(np.int64), 0, np.maximum(n - 1, 0))
+    next_idx = np.minimum(prev_idx + 1, np.maximum(n - 1, 0))
+    gamma = virtual_idx - prev_idx
+    cols = np.arange(values.shape[1])
+    a, b = sorted_values[prev_idx, cols], sorted_values[next_idx, cols]
+    with np.errstate(invalid="ignore"):
+        diff = b - a
+        result = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma) # same interpolation as numpy's _lerp
+    return np.where(has_nan | (n == 0), np.nan, result)
+
+class PortfolioRunWriter:
+    """
+    Writes the portfolios of all channels of one run into a single .npz file (instead of three csvs per channel).
+    Every channel is stored as a few numpy arrays (positions matrices, column names, trade log columns), the date index and the run settings are stored once.
+    Channels are written one by one, so the full run never has to be held in memory.
+    """
+    def __init__(self, path, settings=None):
+        if os.path.exists(path):
+            raise FileExistsError(f"File {path} already exists. Delete or move it.")
+        self.path = path
+        self.settings = settings
+        self.channel_ids = []
+        self.dates = None # date strings, shared by all channels of a run
+        self.zf = zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def _write_array(self, name, arr):
+        with self.zf.open(f"{name}.npy", mode="w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asarray(arr), allow_pickle=False)
+
+    def write(self, channel_id, pos_df_bt, pos_df_at, trade_logs_df):
+        dates = _date_strings(pos_df_at.index)
+        if self.dates is None:
+            self.dates = dates
+            self._write_array("dates", dates)
+        elif not (np.array_equal(self.dates, dates) and np.array_equal(self.dates, _date_strings(pos_df_bt.index))):
+            raise ValueError(f"PortfolioRunWriter: Positions index of channel {channel_id} does not match the index of previously written channels.")
+
+        key = f"c{len(self.channel_ids)}" # channel ids are only stored in the index (no restrictions on characters)
+        self._write_array(f"{key}/pos_bt", pos_df_bt.to_numpy(dtype=np.float64))
+        self._write_array(f"{key}/pos_bt_cols", np.array(pos_df_bt.columns.tolist(), dtype=str))
+        self._write_array(f"{key}/pos_at", pos_df_at.to_numpy(dtype=np.float64))
+        self._write_array(f"{key}/pos_at_cols", np.array(pos_df_at.columns.tolist(), dtype=str))
+        for col in PortfolioRunReader.trade_logs_cols:
+            values = trade_logs_df[col].tolist()
+            self._write_array(f"{key}/trade_logs_{col}", np.array(values, dtype=bool) if col == "executed" else np.array(values, dtype=str))
+        self.channel_ids.append(channel_id)
+
+    def close(self):
+        if self.zf is None:
+            return
+        if self.dates is None:
+            self._write_array("dates", np.array([], dtype=str))
+        self._write_array("channel_ids", np.array(self.channel_ids, dtype=str))
+        self._write_array("settings", np.array(json.dumps(self.settings)))
+        self.zf.close()
+        self.zf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class PortfolioRunReader:
+    """
+    Reads portfolios written by PortfolioRunWriter. Channels are loaded lazily (only the arrays of the requested channel are read from disk).
+    Returned dfs match the old csv round trip ("YYYY-MM-DD" string index), so Portfolio objects behave the same.
+    """
+    trade_logs_cols = ["trade_date", "ticker", "sentiment", "executed", "reason"]
+
+    def __init__(self, path):
+        self.path = path
+        self.npz = np.load(path, allow_pickle=False)
+        self.dates = pd.Index(self.npz["dates"].tolist())
+        self.channel_ids = self.npz["channel_ids"].tolist()
+        self.channel_keys = {channel_id: f"c{i}" for i, channel_id in enumerate(self.channel_ids)}
+        self.settings = json.loads(self.npz["settings"].item())
+
+    def load(self, channel_id):
+        # returns (pos_df_bt, pos_df_at, trade_logs_df) of a single channel
+        if channel_id not in self.channel_keys:
+            raise KeyError(f"PortfolioRunReader: channel_id {channel_id} not found in {self.path}.")
+        key = self.channel_keys[channel_id]
+        pos_df_bt = pd.DataFrame(self.npz[f"{key}/pos_bt"], index=self.dates, columns=self.npz[f"{key}/pos_bt_cols"].tolist())
+        pos_df_at = pd.DataFrame(self.npz[f"{key}/pos_at"], index=self.dates, columns=self.npz[f"{key}/pos_at_cols"].tolist())
+        trade_logs_df = pd.DataFrame({col: (self.npz[f"{key}/trade_logs_{col}"] if col == "executed" else self.npz[f"{key}/trade_logs_{col}"].astype(object))
+                                      for col in self.trade_logs_cols})
+        return pos_df_bt, pos_df_at, trade_logs_df
+
+    def load_portfolio(self, channel_id):
+        pos_df_bt, pos_df_at, trade_logs_df = self.load(channel_id)
+        return Portfolio(pos_df_bt=pos_df_bt, pos_df_at=pos_df_at, trade_logs_df=trade_logs_df, compute_settings=self.settings, channel_id=channel_id)
+
+    def close(self):
+        self.npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _date_strings(index):
+    # "YYYY-MM-DD" strings for datetime or (already) string indices
+    if isinstance(index, pd.DatetimeIndex):
+        return np.array(index.strftime("%Y-%m-%d").tolist(), dtype=str)
+    return np.array(index.tolist(), dtype=str)
+
+class SharedReturnsMatrix:
+    """
+    Holds the full returns data as a single float64 block (column-major, so every ticker column is contiguous) in shared memory or in a memory-mapped .npy file, 
+    together with the dates and a ticker -> column index. Can be passed to PortfolioBuilder instead of the returns df.
+    Pickling only transfers a handle (shared memory name or .npy path + dates/tickers), so worker processes attach to the same block instead of copying the data or re-reading the returns csvs.
+    """
+    def __init__(self, values, index, columns, backend, shm=None, path=None, owner=False):
+        self.values = values # (days x tickers) float64 array (read-only view on the shared block)
+        self.index = pd.Index(index) # "YYYY-MM-DD" date strings (same as the returns df index)
+        self.columns = pd.Index(columns)
+        self.column_idx = {t: i for i, t in enumerate(self.columns)} # ticker -> column index
+        self.backend = backend # "shared_memory" or "npy"
+        self.shm = shm
+        self.path = path
+        self.owner = owner # only the creating process unlinks the shared memory block
+
+    @classmethod
+    def from_df(cls, returns_df, backend="shared_memory", path=None):
+        # copy returns df into a new shared memory block (backend="shared_memory") or a new .npy file at path (backend="npy")
+        shape = returns_df.shape
+        if backend == "shared_memory":
+            shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+            values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F")
+        elif backend == "npy":
+            if path is None:
+                raise ValueError("SharedReturnsMatrix: backend 'npy' requires a path.")
+            shm = None
+            values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape, fortran_order=True)
+        else:
+            raise ValueError("Invalid backend option!")
+        # fill column by column (avoids a temporary full-size copy for mixed-dtype dfs)
+        for i in range(shape[1]):
+            values[:, i] = returns_df.iloc[:, i].to_numpy(dtype=np.float64)
+        if backend == "npy":
+            values.flush()
+            # dates and tickers go into a json sidecar file
+            with open(f"{path}.json", "w") as f:
+                json.dump({"index": returns_df.index.tolist(), "columns": returns_df.columns.tolist()}, f)
+            values = np.load(path, mmap_mode="r")
+        values.flags.writeable = False
+        return cls(values, returns_df.index, returns_df.columns, backend, shm=shm, path=path, owner=True)
+
+    @classmethod
+    def load_npy(cls, path):
+        # attach to a .npy file written by from_df(..., backend="npy") (memory-mapped, nothing is read until accessed)
+        with open(f"{path}.json", "r") as f:
+            meta = json.load(f)
+        return cls(np.load(path, mmap_mode="r"), meta["index"], meta["columns"], "npy", path=path)
+
+    @classmethod
+    def _attach_shared_memory(cls, name):
+        # note: pool workers share the resource tracker of the creating process, so (re-)registering the block on attach is harmless there
+        try:
+            return shared_memory.SharedMemory(name=name, track=False) # python 3.13+
+        except TypeError:
+            return shared_memory.SharedMemory(name=name)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def column(self, ticker):
+        # zero-copy view on a single ticker column
+        return self.values[:, self.column_idx[ticker]]
+
+    def get_columns(self, tickers):
+        # df with the given ticker columns (copies only these columns)
+        return pd.DataFrame(self.values[:, [self.column_idx[t] for t in tickers]], index=self.index, columns=tickers)
+
+    def to_df(self):
+        return self.get_columns(self.columns.tolist())
+
+    def close(self):
+        # release this process' view of the shared block
+        self.values = None
+        if self.shm is not None:
+            self.shm.close()
+
+    def unlink(self):
+        # free the shared memory block (creating process only, after all workers are done)
+        self.close()
+        if self.shm is not None and self.owner:
+            self.shm.unlink()
+
+    def __getstate__(self):
+        # only pickle the handle, not the data
+        return {"name": self.shm.name if self.shm is not None else None, "path": self.path, "shape": self.values.shape, 
+                "index": self.index.tolist(), "columns": self.columns.tolist(), "backend": self.backend}
+
+    def __setstate__(self, state):
+        if state["backend"] == "shared_memory":
+            shm = self._attach_shared_memory(state["name"])
+            values = np.ndarray(state["shape"], dtype=np.float64, buffer=shm.buf, order="F")
+        else:
+            shm = None
+            values = np.load(state["path"], mmap_mode="r")
+        values.flags.writeable = False
+        self.__init__(values, state["index"], state["columns"], state["backend"], shm=shm, path=state["path"])
+
+class ReturnsStore:
+    """
+    Compact on-disk returns store (replacing the returns csvs in data/asset_data/returns) with one partition per asset type.
+    Each partition is a column-major float32/float64 .npy matrix (days x tickers), all partitions share a datetime64 dates array, and index.json holds the 
+    tickers per partition (-> ticker -> column hash index). Partitions are memory-mapped, so only the requested ticker columns are ever read.
+    Layout: store_dir/dates.npy, store_dir/{asset_type}.npy, store_dir/index.json
+    """
+    returns_csv_names = {"stock": "stocks_returns.csv", "etf": "etfs_returns.csv", "crypto": "cryptos_returns.csv", "commodity": "commodities_returns.csv", "benchmark": "benchmarks_returns.csv"}
+
+    def __init__(self, store_dir, ticker_sep="+"):
+        self.store_dir = store_dir
+        self.ticker_sep = ticker_sep # separator of the f"{asset_type}{ticker_sep}{ticker}" column names used by all methods
+        with open(os.path.join(store_dir, "index.json"), "r") as f:
+            meta = json.load(f)
+        self.dtype = np.dtype(meta["dtype"])
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(store_dir, "dates.npy")), name="date")
+        self.asset_types = list(meta["tickers"].keys()) # partition order (= column order of load())
+        self.ticker_index = {asset_type: {t: i for i, t in enumerate(tickers)} for asset_type, tickers in meta["tickers"].items()} # asset_type -> ticker -> column index
+        self._partitions = {} # asset_type -> memory-mapped matrix (opened on first access)
+
+    @classmethod
+    def write(cls, store_dir, returns_dfs, dtype=np.float64, ticker_sep="+"):
+        # returns_dfs: dict asset_type -> returns df with tickers (without asset type prefix) as columns and a "date" index or column ("YYYY-MM-DD"), all with the same dates
+        os.makedirs(store_dir, exist_ok=True)
+        dates, tickers = None, {}
+        for asset_type, df in returns_dfs.items():
+            if "date" in df.columns:
+                df = df.set_index("date")
+            if dates is None:
+                dates = df.index
+                np.save(os.path.join(store_dir, "dates.npy"), pd.to_datetime(dates).to_numpy(dtype="datetime64[D]"))
+            elif not df.index.equals(dates):
+                raise ValueError(f"ReturnsStore: Dates of the {asset_type} returns do not match the dates of the other partitions.")
+            values = np.lib.format.open_memmap(os.path.join(store_dir, f"{asset_type}.npy"), mode="w+", dtype=dtype, shape=df.shape, fortran_order=True)
+            # fill column by column (avoids a temporary full-size copy)
+            for i in range(df.shape[1]):
+                values[:, i] = df.iloc[:, i].to_numpy(dtype=dtype)
+            values.flush()
+            del values
+            tickers[asset_type] = [str(t) for t in df.columns]
+        with open(os.path.join(store_dir, "index.json"), "w") as f:
+            json.dump({"dtype": np.dtype(dtype).name, "tickers": tickers}, f)
+        return cls(store_dir, ticker_sep=ticker_sep)
+
+    @classmethod
+    def from_returns_csvs(cls, store_dir, returns_path="../data/asset_data/returns", dtype=np.float64, ticker_sep="+"):
+        # one-time conversion of the returns csvs (one partition per asset type)
+        returns_dfs = {asset_type: pd.read_csv(os.path.join(returns_path, name), sep=";", index_col="date") for asset_type, name in cls.returns_csv_names.items()}
+        return cls.write(store_dir, returns_dfs, dtype=dtype, ticker_sep=ticker_sep)
+
+    def partition(self, asset_type):
+        # memory-mapped (days x tickers) matrix of an asset type (read-only)
+        if asset_type not in self._partitions:
+            self._partitions[asset_type] = np.load(os.path.join(self.store_dir, f"{asset_type}.npy"), mmap_mode="r")
+        return self._partitions[asset_type]
+
+    def tickers(self, asset_type):
+        return list(self.ticker_index[asset_type].keys())
+
+    def column(self, asset_type, ticker):
+        # zero-copy view on a single ticker column
+        return self.partition(asset_type)[:, self.ticker_index[asset_type][ticker]]
+
+    def __contains__(self, column):
+        # column: f"{asset_type}{ticker_sep}{ticker}"
+        asset_type, _, ticker = column.partition(self.ticker_sep)
+        return ticker in self.ticker_index.get(asset_type, {})
+
+    def load(self, columns=None, date_strings=True):
+        # returns df with f"{asset_type}{ticker_sep}{ticker}" columns (same format as the joined returns df in portfolio_building.ipynb), reading only the requested columns
+        # columns: list of f"{asset_type}{ticker_sep}{ticker}" names (KeyError if not in the store), None for all columns (in partition order)
+        # date_strings: "YYYY-MM-DD" string index (as expected by PortfolioBuilder), otherwise the DatetimeIndex
+        ticker_sep = self.ticker_sep
+        if columns is None:
+            columns = [f"{asset_type}{ticker_sep}{t}" for asset_type in self.asset_types for t in self.ticker_index[asset_type]]
+        values = np.empty((len(self.dates), len(columns)), dtype=self.dtype, order="F")
+        # gather the requested columns per partition (one fancy-indexing read per partition)
+        positions = {}
+        for i, c in enumerate(columns):
+            asset_type, _, ticker = c.partition(ticker_sep)
+            if ticker not in self.ticker_index.get(asset_type, {}):
+                raise KeyError(f"ReturnsStore: No returns for {c}.")
+            positions.setdefault(asset_type, ([], []))
+            positions[asset_type][0].append(i)
+            positions[asset_type][1].append(self.ticker_index[asset_type][ticker])
+        for asset_type, (out_idx, col_idx) in positions.items():
+            values[:, out_idx] = self.partition(asset_type)[:, col_idx]
+        index = pd.Index(self.dates.strftime("%Y-%m-%d"), name="date") if date_strings else self.dates
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+    def load_partition(self, asset_type, date_strings=True):
+        # full partition as df without copying (backed by the memory-mapped file, read-only), columns without asset type prefix
+        index = pd.Index(self.dates.strftime("%Y-%m-%d"), name="date") if date_strings else self.dates
+        return pd.DataFrame(self.partition(asset_type), index=index, columns=self.tickers(asset_type), copy=False)
+
+    def load_for_extractions(self, extractions_df):
+        # returns df with only the assets recommended in extractions_df (trade_info column, see PortfolioBuilder) that have returns + all benchmark columns, in store column order
+        ticker_sep = self.ticker_sep
+        needed = set()
+        for trade_info in extractions_df["trade_info"]:
+            for t in json.loads(trade_info):
+                needed.add(f"{t['asset_type']}{ticker_sep}{t['ticker']}")
+        columns = [f"{asset_type}{ticker_sep}{t}" for asset_type in self.asset_types for t in self.ticker_index[asset_type]
+                   if asset_type == "benchmark" or f"{asset_type}{ticker_sep}{t}" in needed]
+        return self.load(columns)
+
+class TradingCalendar:
+    """
+    Sorted array of trading days with O(log n) next-trading-day lookups via np.searchsorted (vectorized for whole columns of dates).
+    """
+    def __init__(self, dates):
+        # dates: any list-like of dates (e.g. returns_df.index with "YYYY-MM-DD" strings), sorted + deduplicated here
+        self.days = pd.DatetimeIndex(np.unique(pd.to_datetime(dates).values))
+        self._values = self.days.values # datetime64[ns]
+
+    def __len__(self):
+        return len(self.days)
+
+    def next_trading_day(self, dates, min_days_wait=0):
+        # next trading day on or after date + min_days_wait (calendar days, not trading days!) 
+        # NaT/None if beyond the last trading day. scalar in -> Timestamp out, Series in -> Series with same index, otherwise DatetimeIndex
+        is_scalar = pd.api.types.is_scalar(dates)
+        target_dates = pd.to_datetime(pd.Series([dates]) if is_scalar else dates) + pd.Timedelta(days=min_days_wait)
+        target_values = np.asarray(target_dates, dtype="datetime64[ns]")
+        pos = np.searchsorted(self._values, target_values, side="left") # NaT targets sort to the end -> NaT
+        if len(self._values) > 0:
+            next_days = np.where(pos < len(self._values), self._values[np.minimum(pos, len(self._values) - 1)], np.datetime64("NaT"))
+        else:
+            next_days = np.full(len(target_values), np.datetime64("NaT"), dtype="datetime64[ns]")
+        if is_scalar:
+            return pd.Timestamp(next_days[0])
+        if isinstance(dates, pd.Series):
+            return pd.Series(next_days, index=dates.index, name=dates.name)
+        return pd.DatetimeIndex(next_days)
+
+    def to_frame(self, start_date=None, end_date=None):
+        # single-column df with "YYYY-MM-DD" date strings (same format as asset_data_utils.get_US_trading_dates)
+        days = self.days
+        if start_date is not None:
+            days = days[days >= pd.to_datetime(start_date)]
+        if end_date is not None:
+            days = days[days <= pd.to_datetime(end_date)]
+        return pd.DataFrame({"date": days.strftime("%Y-%m-%d")})
+
+class PhaseProfiler:
+    """
+    Opt-in instrumentation for PortfolioBuilder (set builder.profiler = PhaseProfiler()): records wall time, processed rows and (optionally) 
+    net allocated memory (tracemalloc) per phase of compute_portfolio and channel. Phases: "raw_trades", "prep_returns", "simulation", "postprocessing".
+    Nested phases are recorded exclusively, i.e. "simulation" does not include the time of its "postprocessing".
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory # note: tracemalloc slows down all python allocations considerably
+        self.records = []
+        self.channel_id = None # channel of the current compute_portfolio call
+        self._stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # yields the record dict of the phase, callers can set record["rows"]
+        record = {"channel_id": self.channel_id, "phase": name, "wall_time_s": 0., "rows": None}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            mem_start = tracemalloc.get_traced_memory()[0]
+        self._stack.append([record, 0., 0]) # record, time of child phases, memory of child phases
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            elapsed = time.perf_counter() - start_time
+            _, child_time, child_mem = self._stack.pop()
+            record["wall_time_s"] = elapsed - child_time
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            if self.trace_memory:
+                mem = tracemalloc.get_traced_memory()[0] - mem_start
+                record["alloc_mb"] = (mem - child_mem) / 1e6
+                if self._stack:
+                    self._stack[-1][2] += mem
+            self.records.append(record)
+
+    def reset(self):
+        self.records = []
+
+    def to_df(self):
+        # one row per recorded phase call
+        if not self.records:
+            return pd.DataFrame(columns=["channel_id", "phase", "wall_time_s", "rows"] + (["alloc_mb"] if self.trace_memory else []))
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        # aggregated per phase (over all channels/settings of the recorded run)
+        df = self.to_df()
+        agg = {"n_calls": ("wall_time_s", "size"), "total_wall_time_s": ("wall_time_s", "sum"), "mean_wall_time_s": ("wall_time_s", "mean"), 
+               "max_wall_time_s": ("wall_time_s", "max"), "total_rows": ("rows", "sum")}
+        if "alloc_mb" in df.columns:
+            agg["total_alloc_mb"] = ("alloc_mb", "sum")
+        summary_df = df.groupby("phase", sort=False).agg(**agg)
+        summary_df["share_of_time"] = summary_df["total_wall_time_s"] / summary_df["total_wall_time_s"].sum()
+        return summary_df
+
+_no_profiling = contextlib.nullcontext() # used by PortfolioBuilder._profile if no profiler is set
+
+class SparsePositions:
+    """
+    Sparse (COO) positions of a portfolio: one entry per (running day, asset) with a non-zero position, so memory is proportional to the actual holdings 
+    instead of running days x considered tickers. Dense positions dfs (same as returned by PortfolioBuilder.compute_portfolio) are only built on request.
+    """
+    def __init__(self, days, columns, day_idx, col_idx, values):
+        self.days = days # running days (DatetimeIndex)
+        self.columns = list(columns) # all considered tickers + neutral asset (last column)
+        self.day_idx = day_idx
+        self.col_idx = col_idx
+        self.values = values
+
+    @classmethod
+    def from_daily_entries(cls, days, columns, daily_col_idx, daily_values):
+        # daily_col_idx/daily_values: lists with one array of column indices/values per running day
+        n_entries = np.array([len(x) for x in daily_col_idx], dtype=np.int64)
+        day_idx = np.repeat(np.arange(len(days), dtype=np.int64), n_entries)
+        col_idx = np.concatenate(daily_col_idx) if len(daily_col_idx) > 0 else np.array([], dtype=np.int64)
+        values = np.concatenate(daily_values) if len(daily_values) > 0 else np.array([], dtype=np.float64)
+        return cls(days, columns, day_idx, col_idx, values)
+
+    @property
+    def nbytes(self):
+        return self.day_idx.nbytes + self.col_idx.nbytes + self.values.nbytes
+
+    def to_dense(self):
+        # dense positions df, dropping all-zero ticker columns (neutral asset column is always kept as last column), identical to the dense engine outputs
+        neutral_col = len(self.columns) - 1
+        kept_cols = np.union1d(np.unique(self.col_idx[self.col_idx != neutral_col]), [neutral_col]).astype(np.int64)
+        dense = np.zeros((len(self.days), len(kept_cols)))
+        dense[self.day_idx, np.searchsorted(kept_cols, self.col_idx)] = self.values
+        return pd.DataFrame(dense, index=self.days, columns=[self.columns[i] for i in kept_cols])
+
+    def holding_intervals(self):
+        # one row per contiguous holding period of a ticker (neutral asset excluded): ticker, entry_date, exit_date (last day with non-zero position), n_days, 
+        # and the weight path (position values over the interval, as list)
+        mask = self.col_idx != len(self.columns) - 1
+        order = np.lexsort((self.day_idx[mask], self.col_idx[mask]))
+        cols, days, values = self.col_idx[mask][order], self.day_idx[mask][order], self.values[mask][order]
+        # new interval whenever the ticker changes or a day is skipped
+        starts = np.flatnonzero(np.r_[True, (cols[1:] != cols[:-1]) | (days[1:] != days[:-1] + 1)])
+        ends = np.r_[starts[1:], len(cols)]
+        return pd.DataFrame({"ticker": [self.columns[i] for i in cols[starts]],
+                             "entry_date": self.days[days[starts]],
+                             "exit_date": self.days[days[ends - 1]],
+                             "n_days": ends - starts,
+                             "weight_path": [values[a:b].tolist() for a, b in zip(starts, ends)]})
+
 class PortfolioBuilder:
     """
     The PortfolioBuilder class is used to build portfolios from extractions and returns data. Holds full set of returns data but selects appropriate subset in preparation for portfolio computation. 
@@ -157,7 +776,7 @@ class PortfolioBuilder:
 
         ### base data
         self.ext = extractions_df[["video_id", "upload_date", "channel_id", "trade_info"]] # "trade_info" should contain list of json objects
-        self.returns = returns_df # column names should be f"{asset_type}{ticker_sep}{ticker}" (e.g. "stock+AAPL", "crypto+BTC", etc.), index should be "YYYY-MM-DD" date strings.
+        self.returns = returns_df # column names should be f"{asset_type}{ticker_sep}{ticker}" (e.g. "stock+AAPL", "crypto+BTC", etc.), index should be "YYYY-MM-DD" date strings. can also be a SharedReturnsMatrix
         self.asset_types = ["stock", "crypto", "etf", "commodity", 
                             "benchmark" # benchmark assets such as cash, risk-free rate, SPY, etc.
         ]
@@ -175,7 +794,8 @@ class PortfolioBuilder:
                              "max_positions": 10000, # max number of non-cash positions in a portfolio (sell oldest positions if exceeded)
                              "max_holding_period": 252, # max number of trading days to hold a position (sell if exceeded)
                              "neutral_asset": "cash", # asset to hold in place of cash (must be available as column in benchmark returns data)
-                             "min_days_wait_after_upload": 1 # min number of days (not trading days!) after video upload date to start trading -> should be at least 1 to avoid lookahead bias (we trade EOD but video could have been uploaded after market close with new information)
+                             "min_days_wait_after_upload": 1, # min number of days (not trading days!) after video upload date to start trading -> should be at least 1 to avoid lookahead bias (we trade EOD but video could have been uploaded after market close with new information)
+                             "engine": "event_driven" # "event_driven" (only runs trading logic on days with trades/forced sells) or "daily_loop" (original implementation, identical results)
                              }
         self.neutral_asset_ticker = f"benchmark{self.ticker_sep}{self.settings['neutral_asset']}"
         
@@ -183,12 +803,15 @@ class PortfolioBuilder:
 
         # get trading days from returns data (as datetimes)
         self.trading_days = pd.to_datetime(returns_df.index)
+        self.calendar = TradingCalendar(self.trading_days)
+        # optional PhaseProfiler (None -> no instrumentation)
+        self.profiler = None
 
         ### a few preprocessing steps for the extraction data
         # 1. remove rows with empty trade_info
         self.ext = self.ext[self.ext["trade_info"] != "[]"]
         # 2. compute trade_date col (next trading day after upload_date)
-        self.ext["trade_date"] = self.ext["upload_date"].apply(lambda x: self._get_next_trading_day(x, min_days_wait=self.settings["min_days_wait_after_upload"]))
+        self.ext["trade_date"] = self.calendar.next_trading_day(self.ext["upload_date"], min_days_wait=self.settings["min_days_wait_after_upload"])
         # 3. remove rows with trade_date outside of start_date and end_date (if given) (note: also removes rows with missing trade_date)
         if self.settings["pf_start_date"] is not None:
             self.ext = self.ext[self.ext["trade_date"] >= self.settings["pf_start_date"]]
@@ -196,104 +819,322 @@ class PortfolioBuilder:
             self.ext = self.ext[self.ext["trade_date"] <= self.settings["pf_end_date"]]
 
         print(f"PortfolioBuilder: Only considering videos with non-empty trade_info: {len(self.ext)} videos from {len(self.ext['channel_id'].unique())} unique channels.")
+
+        ### parse all trade_info json once (flat trades table for all channels) and cache the filtered per-channel trades 
+        # (the filters don't depend on any of the updatable settings, so this is shared by all settings combinations)
+        self.trades = self._parse_trade_info(self.ext)
+        filtered_trades, self._dropped_sells = self._filter_trades(self.trades, remove_sells_without_preceding_buys=True, remove_buys_with_same_day_sells=True)
+        self._channel_trades = {channel_id: df.drop(columns=["channel_id"]).reset_index(drop=True) for channel_id, df in filtered_trades.groupby("channel_id", sort=False)}
         
-    def update_settings(self, new_settings):
+    def update_settings(self, new_settings, verbose=True):
         if "pf_start_date" in new_settings or "pf_end_date" in new_settings:
             raise ValueError("Updating start or end date requires re-instantiation of the PortfolioBuilder object.")
         self.settings.update(new_settings)
         self.neutral_asset_ticker = f"benchmark{self.ticker_sep}{self.settings['neutral_asset']}"
-        print("PortfolioBuilder: Updated settings.")
+        if verbose:
+            print("PortfolioBuilder: Updated settings.")
 
-    def compute_portfolio(self, channel_id, return_before_and_after_trading_positions=True, return_portfolio_object=False, debug=False):
+    def compute_portfolio(self, channel_id, return_before_and_after_trading_positions=True, return_portfolio_object=False, return_checkpoint=False, return_sparse=False, debug=False):
+        # return_checkpoint: additionally return a checkpoint dict (see append_to_portfolio), only supported by the event_driven engine
+        # return_sparse: return SparsePositions objects instead of positions dfs (dense dfs via .to_dense()), only supported by the event_driven engine
         
+        if self.profiler is not None:
+            self.profiler.channel_id = channel_id
+
         # get initial trades_df
-        trades_df = self._get_raw_trades_from_recs(channel_id, remove_sells_without_preceding_buys=True, remove_buys_with_same_day_sells=True, debug=debug)
+        with self._profile("raw_trades") as phase:
+            trades_df = self._get_raw_trades_from_recs(channel_id, remove_sells_without_preceding_buys=True, remove_buys_with_same_day_sells=True, debug=debug)
+            if phase is not None:
+                phase["rows"] = len(trades_df)
 
         # get unique tickers for this portfolio
         unique_assets = trades_df["ticker"].unique().tolist()
 
         # get required subsets of return data and return availability for this portfolio
-        ret_df, ret_av = self._prep_pf_returns_data(unique_assets)
+        with self._profile("prep_returns") as phase:
+            ret_df, ret_av = self._prep_pf_returns_data(unique_assets)
+            if phase is not None:
+                phase["rows"] = ret_df.size
+
+        if return_checkpoint:
+            if self.settings["portfolio_type"] != "equal_weight" or self.settings.get("engine", "event_driven") != "event_driven":
+                raise ValueError("Checkpoints are only supported for equal_weight portfolios with the event_driven engine.")
+            running_days_mask = (self.trading_days >= self.settings["pf_start_date"]) & (self.trading_days <= self.settings["pf_end_date"])
+            with self._profile("simulation") as phase:
+                pos_df_bt, pos_df_at, trade_logs_df, checkpoint = self._simulate_with_checkpoint(channel_id, trades_df, ret_df, ret_av, running_days_mask, debug=debug)
+                if phase is not None:
+                    phase["rows"] = len(pos_df_at)
+            if return_portfolio_object:
+                return Portfolio(pos_df_bt=pos_df_bt, pos_df_at=pos_df_at, trade_logs_df=trade_logs_df, compute_settings=dict(self.settings), channel_id=channel_id), checkpoint
+            return pos_df_bt, pos_df_at, trade_logs_df, checkpoint
+
+        if return_sparse:
+            if self.settings["portfolio_type"] != "equal_weight" or self.settings.get("engine", "event_driven") != "event_driven":
+                raise ValueError("Sparse positions are only supported for equal_weight portfolios with the event_driven engine.")
+            if return_portfolio_object:
+                raise ValueError("Portfolio objects require dense positions, use return_sparse=False.")
+            with self._profile("simulation") as phase:
+                res = self._compute_equal_weight_portfolio_event_driven(trades_df, ret_df, ret_av, return_before_and_after_trading_positions=return_before_and_after_trading_positions, 
+                                                                        sparse=True, debug=debug)
+                if phase is not None:
+                    phase["rows"] = len(res[0].days)
+            return res
 
         # perform portfolio computation with desired strategy
         if self.settings["portfolio_type"] == "equal_weight":
-            pos_df_bt, pos_df_at, trade_logs_df = self._compute_equal_weight_portfolio(trades_df, 
-                                                                                       ret_df, 
-                                                                                       ret_av, 
-                                                                                       return_before_and_after_trading_positions=return_before_and_after_trading_positions, 
-                                                                                       debug=debug)
+            with self._profile("simulation") as phase: # excludes the nested "postprocessing" phase
+                pos_df_bt, pos_df_at, trade_logs_df = self._get_equal_weight_engine()(trades_df, 
+                                                                                      ret_df, 
+                                                                                      ret_av, 
+                                                                                      return_before_and_after_trading_positions=return_before_and_after_trading_positions, 
+                                                                                      debug=debug)
+                if phase is not None:
+                    phase["rows"] = len(pos_df_at)
         else:
             raise ValueError("Invalid portfolio_type option!")
         
         if return_portfolio_object:
-            return Portfolio(trade_logs_df, pos_df_at, pos_df_bt, self.settings)
+            return Portfolio(pos_df_bt=pos_df_bt, pos_df_at=pos_df_at, trade_logs_df=trade_logs_df, compute_settings=dict(self.settings), channel_id=channel_id)
         else:
             return pos_df_bt, pos_df_at, trade_logs_df
-        
+
+    def append_to_portfolio(self, channel_id, pos_df_bt, pos_df_at, trade_logs_df, checkpoint, debug=False):
+        # continue a previously computed portfolio (see compute_portfolio(..., return_checkpoint=True)) from its checkpoint, only simulating trading days after checkpoint["last_date"]
+        # e.g. after new extractions and/or new returns data arrived: instantiate a new builder with the new data (and a later pf_end_date if needed) and call this with the old results
+        # returns (pos_df_bt, pos_df_at, trade_logs_df, checkpoint) for the full period
+        # notes: 
+        # - the checkpoint is taken at the second-to-last trading day of a run, since forced sells and possible buys on the very last day depend on returns data availability after it
+        # - requires unchanged settings (except for pf_end_date) and unchanged historical returns. if trades up to the checkpoint changed (e.g. new extractions for older videos), a full recomputation is required (ValueError)
+        # - results match a full recomputation up to floating point summation order (the positions matrix can have more columns than in the original run)
+        if checkpoint is None:
+            raise ValueError("No checkpoint available (portfolio period too short), full recomputation required.")
+        if checkpoint["channel_id"] != channel_id:
+            raise ValueError(f"Checkpoint belongs to channel_id {checkpoint['channel_id']}, not {channel_id}.")
+        if checkpoint["settings"] != self._get_checkpoint_settings():
+            raise ValueError("Checkpoint was created with different settings, full recomputation required.")
+        last_date = pd.Timestamp(checkpoint["last_date"])
+
+        trades_df = self._get_raw_trades_from_recs(channel_id, remove_sells_without_preceding_buys=True, remove_buys_with_same_day_sells=True, debug=debug)
+        if self._hash_trades(trades_df, last_date) != checkpoint["trades_hash"]:
+            raise ValueError(f"Trades up to {checkpoint['last_date']} changed since the checkpoint was created, full recomputation required.")
+        ret_df, ret_av = self._prep_pf_returns_data(trades_df["ticker"].unique().tolist())
+
+        # initial state in the column layout of this run
+        tickers = ret_df.columns[:-1].tolist()
+        ticker_idx = {t: i for i, t in enumerate(tickers)}
+        positions = np.zeros(len(tickers) + 1)
+        holding_days = np.zeros(len(tickers), dtype=np.int64)
+        for t in checkpoint["current_tickers"]:
+            positions[ticker_idx[t]] = checkpoint["positions"][t]
+            holding_days[ticker_idx[t]] = checkpoint["holding_days"][t]
+        positions[-1] = checkpoint["neutral_asset_value"]
+
+        running_days_mask = (self.trading_days > last_date) & (self.trading_days <= self.settings["pf_end_date"])
+        new_bt, new_at, new_logs, new_checkpoint = self._simulate_with_checkpoint(channel_id, trades_df, ret_df, ret_av, running_days_mask, 
+                                                                                  initial_state={"positions": positions, "holding_days": holding_days}, debug=debug)
+        if new_checkpoint is None: # less than 2 new trading days -> previous checkpoint is still the latest valid one
+            new_checkpoint = checkpoint
+
+        # combine with previous results up to (and including) the checkpoint date
+        def combine_positions(old_df, new_df):
+            old_df = old_df[pd.to_datetime(old_df.index) <= last_date]
+            if not isinstance(old_df.index, pd.DatetimeIndex): # e.g. reloaded from csv -> keep date strings
+                new_df = new_df.set_axis(new_df.index.strftime("%Y-%m-%d"), axis=0)
+            cols = [t for t in tickers if t in old_df.columns or t in new_df.columns] + [self.neutral_asset_ticker]
+            df = pd.concat([old_df.reindex(columns=cols, fill_value=0.), new_df.reindex(columns=cols, fill_value=0.)], axis=0)
+            # drop all-zero cols again (as for a full computation)
+            return pd.concat([df.iloc[:, :-1].loc[:, (df.iloc[:, :-1] != 0).any(axis=0)], df.iloc[:, -1]], axis=1)
+
+        pos_df_bt = combine_positions(pos_df_bt, new_bt)
+        pos_df_at = combine_positions(pos_df_at, new_at)
+        trade_logs_df = pd.concat([trade_logs_df[pd.to_datetime(trade_logs_df["trade_date"]) <= last_date], new_logs], axis=0).reset_index(drop=True)
+        return pos_df_bt, pos_df_at, trade_logs_df, new_checkpoint
+
+    @staticmethod
+    def settings_grid(**param_lists):
+        # expand lists of setting values into a list of settings dicts (all combinations, same order as itertools.product)
+        # e.g. settings_grid(neutral_asset=["cash", "SPY"], max_positions=[5, 99999]) -> 4 settings dicts
+        keys = list(param_lists.keys())
+        return [dict(zip(keys, values)) for values in itertools.product(*param_lists.values())]
+
+    def run_grid(self, settings_list, channel_ids=None, n_workers=None, return_portfolio_objects=False, print_every=100):
+        # compute portfolios for all (settings, channel) combinations in parallel worker processes
+        # - settings_list: list of settings dicts, each applied on top of the current settings (like update_settings)
+        # - returns (results, timings_df), where results is a list of (settings_idx, channel_id, result) tuples in stable order (settings first, then channel_ids)
+        #   and result is either (pos_df_bt, pos_df_at, trade_logs_df) or a Portfolio object
+        # note: with the "fork" start method (default on linux) workers inherit the builder (incl. returns data) without any pickling,
+        #       otherwise the builder is pickled once per worker (not once per job; only a handle if the returns are a SharedReturnsMatrix)
+        # careful: the daily set iteration order depends on the hash seed of the process. It determines the row order of the trade logs (and breaks ties in max positions sells,
+        #          i.e. same holding days). Forked workers share the seed of this process, with other start methods the trade logs (not only the tie-breaking) are only
+        #          reproducible with a fixed PYTHONHASHSEED
+        if channel_ids is None:
+            channel_ids = self.ext["channel_id"].unique()
+        for settings in settings_list:
+            if "pf_start_date" in settings or "pf_end_date" in settings:
+                raise ValueError("Updating start or end date requires re-instantiation of the PortfolioBuilder object.")
+        if n_workers is None:
+            n_workers = os.cpu_count()
+
+        jobs = [(job_idx, settings_idx, settings, channel_id) 
+                for job_idx, ((settings_idx, settings), channel_id) in enumerate(itertools.product(enumerate(settings_list), channel_ids))]
+        print(f"PortfolioBuilder: Running {len(jobs)} jobs ({len(settings_list)} settings x {len(channel_ids)} channels) with {n_workers} worker(s).")
+
+        results = [None] * len(jobs)
+        timings = [None] * len(jobs)
+        start_time = time.time()
+
+        def collect(job_result, n_done):
+            job_idx, result, compute_time, worker_pid, profile_records = job_result
+            _, settings_idx, _, channel_id = jobs[job_idx]
+            if profile_records is not None:
+                self.profiler.records.extend(dict(record, settings_idx=settings_idx) for record in profile_records)
+            results[job_idx] = (settings_idx, channel_id, result)
+            timings[job_idx] = {"job_idx": job_idx, "settings_idx": settings_idx, "channel_id": channel_id, "worker_pid": worker_pid, "compute_time": compute_time}
+            if print_every and n_done % print_every == 0:
+                print(f"  - Completed {n_done}/{len(jobs)} jobs in {time.time()-start_time:.2f}s")
+
+        if n_workers == 1:
+            # run in this process (useful for debugging)
+            _init_grid_worker(self)
+            try:
+                for n_done, job in enumerate(jobs, start=1):
+                    collect(_run_grid_job(job, return_portfolio_objects), n_done)
+            finally:
+                # the jobs change the settings of this builder, restore them (incl. the derived neutral asset ticker)
+                self.settings = dict(_grid_base_settings)
+                self.update_settings({}, verbose=False)
+        else:
+            ctx = multiprocessing.get_context()
+            if ctx.get_start_method() == "fork":
+                # workers inherit the module-level builder reference (copy-on-write)
+                _init_grid_worker(self)
+                executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx)
+            else:
+                executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, initializer=_init_grid_worker, initargs=(self,))
+            with executor:
+                futures = [executor.submit(_run_grid_job, job, return_portfolio_objects) for job in jobs]
+                for n_done, future in enumerate(as_completed(futures), start=1):
+                    collect(future.result(), n_done)
+        _init_grid_worker(None) # release reference in this process
+
+        timings_df = pd.DataFrame(timings, columns=["job_idx", "settings_idx", "channel_id", "worker_pid", "compute_time"])
+        total_time = time.time() - start_time
+        print(f"PortfolioBuilder: Completed {len(jobs)} jobs in {total_time:.2f}s (sum of job compute times: {timings_df['compute_time'].sum():.2f}s).")
+        return results, timings_df
+
+    def compare_engines(self, channel_ids=None, print_every=20):
+        # run both equal weight engines for the given channels (default: all channels), check that the results are identical and time them
+        # returns a df with one row per channel (timings only cover the engine itself, trades and returns prep are shared)
+        if channel_ids is None:
+            channel_ids = self.ext["channel_id"].unique()
+
+        rows = []
+        for i, channel_id in enumerate(channel_ids):
+            trades_df = self._get_raw_trades_from_recs(channel_id, remove_sells_without_preceding_buys=True, remove_buys_with_same_day_sells=True)
+            ret_df, ret_av = self._prep_pf_returns_data(trades_df["ticker"].unique().tolist())
+
+            start_time = time.time()
+            res_loop = self._compute_equal_weight_portfolio(trades_df, ret_df, ret_av)
+            time_loop = time.time() - start_time
+            start_time = time.time()
+            res_event = self._compute_equal_weight_portfolio_event_driven(trades_df, ret_df, ret_av)
+            time_event = time.time() - start_time
+
+            rows.append({"channel_id": channel_id,
+                         "n_trades": len(trades_df),
+                         "n_tickers": ret_df.shape[1] - 1, # excluding neutral asset
+                         "time_daily_loop": time_loop,
+                         "time_event_driven": time_event,
+                         "identical": all(a.equals(b) for a, b in zip(res_loop, res_event))})
+            if print_every and (i+1) % print_every == 0:
+                print(f"  - Compared engines for {i+1}/{len(channel_ids)} channel ids")
+
+        df = pd.DataFrame(rows)
+        print(f"PortfolioBuilder: daily_loop {df['time_daily_loop'].sum():.2f}s vs. event_driven {df['time_event_driven'].sum():.2f}s "
+              f"(speedup x{df['time_daily_loop'].sum() / df['time_event_driven'].sum():.1f}), identical results for {df['identical'].sum()}/{len(df)} channels.")
+        return df
+
             
             
     def _get_raw_trades_from_recs(self, channel_id, remove_sells_without_preceding_buys=False, remove_buys_with_same_day_sells=False, debug=False):
-        
-        ### get raw trades df (not yet taking into account returns data availability, needing to buy before being able to sell, etc.)
-        # get relevant rows from extractions_df
-        df = self.ext[self.ext["channel_id"] == channel_id].copy()
-        
-        # expand trade info json lists into df (-> columns asset_type, ticker, sentiment)
-        df.loc[:, "trade_info"] = df["trade_info"].apply(json.loads)
-        df = df.explode('trade_info').reset_index(drop=True)
-        trades_df = pd.json_normalize(df["trade_info"])
-        # re-add date cols from (now exploded!) extractions df
-        trades_df["trade_date"] = df["trade_date"]
-        trades_df["upload_date"] = df["upload_date"] # only kept for debugging purposes
+        # get raw trades df (not yet taking into account returns data availability, needing to buy before being able to sell, etc.)
+        # columns asset_type, ticker, sentiment, trade_date, upload_date (in order of the extractions df, or sorted by ticker, trade_date, sells first if sells without preceding buys are removed)
+        if remove_sells_without_preceding_buys and remove_buys_with_same_day_sells:
+            # default for all portfolio computations -> precomputed at init
+            if debug and channel_id in self._dropped_sells:
+                num_dropped, dropped_tickers = self._dropped_sells[channel_id]
+                print(f"Removed {num_dropped} sell trades without preceding buy trades for the following tickers: {dropped_tickers}")
+            if channel_id in self._channel_trades:
+                return self._channel_trades[channel_id].copy()
+            return pd.DataFrame(columns=self.trades.columns.drop("channel_id"))
+
+        trades_df, dropped_sells = self._filter_trades(self.trades[self.trades["channel_id"] == channel_id], 
+                                                       remove_sells_without_preceding_buys=remove_sells_without_preceding_buys, 
+                                                       remove_buys_with_same_day_sells=remove_buys_with_same_day_sells)
+        if debug and channel_id in dropped_sells:
+            num_dropped, dropped_tickers = dropped_sells[channel_id]
+            print(f"Removed {num_dropped} sell trades without preceding buy trades for the following tickers: {dropped_tickers}")
+        return trades_df.drop(columns=["channel_id"]).reset_index(drop=True)
+
+    @staticmethod
+    def _parse_trade_info(ext):
+        # expand trade info json lists of all videos into one flat df (-> columns channel_id, asset_type, ticker, sentiment, trade_date, upload_date)
+        # rows are in order of the extractions df (and of the json lists within each video)
+        trade_info = [json.loads(x) for x in ext["trade_info"]]
+        n_trades = np.array([len(x) for x in trade_info], dtype=np.int64)
+        trades_df = pd.DataFrame([t for x in trade_info for t in x], columns=["asset_type", "ticker", "sentiment"])
+        # re-add cols from (repeated) extractions df
+        trades_df.insert(0, "channel_id", np.repeat(ext["channel_id"].to_numpy(), n_trades))
+        trades_df["trade_date"] = np.repeat(ext["trade_date"].to_numpy(), n_trades)
+        trades_df["upload_date"] = np.repeat(ext["upload_date"].to_numpy(), n_trades) # only kept for debugging purposes
 
         # add asset_type prefix to ticker col
         trades_df["ticker"] = trades_df["asset_type"] + "+" + trades_df["ticker"]
+        return trades_df
 
+    @staticmethod
+    def _filter_trades(trades_df, remove_sells_without_preceding_buys=False, remove_buys_with_same_day_sells=False):
+        # vectorized trade filters for a flat trades df of one or more channels (all groupings are per channel)
+        # returns the filtered df and a dict channel_id -> (number of removed sells, tickers) for sells without preceding buys
+        dropped_sells = {}
         if remove_buys_with_same_day_sells:
-            # create helper column
-            trades_df['has_sameday_sell'] = trades_df.groupby(['ticker', 'trade_date'])['sentiment'].transform(lambda x: 'sell' in x.values)
             # remove buy trades with same-day sells
-            trades_df = trades_df[~((trades_df['sentiment'] == 'buy') & (trades_df['has_sameday_sell']))]
-            # remove helper col
-            trades_df = trades_df.drop(columns=['has_sameday_sell']).reset_index(drop=True)
+            has_sameday_sell = (trades_df["sentiment"] == "sell").groupby([trades_df["channel_id"], trades_df["ticker"], trades_df["trade_date"]]).transform("any")
+            trades_df = trades_df[~((trades_df["sentiment"] == "buy") & has_sameday_sell.fillna(False).astype(bool))]
 
         if remove_sells_without_preceding_buys:
-            # add boolean helper column preceding_buy_exists
-            trades_df['sentiment_order'] = trades_df['sentiment'].map({'sell': 0, 'buy': 1})
-            trades_df = trades_df.sort_values(by=['ticker', 'trade_date', 'sentiment_order'])
-            trades_df = trades_df.groupby('ticker', group_keys=False).apply(
-                lambda group: group.assign(preceding_buy_exists=(group['sentiment'] == 'buy').cumsum().shift().fillna(0) > 0))
-            drop_cond = (trades_df['sentiment'] == 'sell') & (~trades_df['preceding_buy_exists'])
+            # sort sells before buys on the same day, then check for a buy of the same ticker in any earlier row (exclusive cumsum)
+            trades_df = trades_df[trades_df["ticker"].notna()]
+            sentiment_order = trades_df["sentiment"].map({"sell": 0, "buy": 1})
+            trades_df = trades_df.assign(sentiment_order=sentiment_order).sort_values(by=["channel_id", "ticker", "trade_date", "sentiment_order"]).drop(columns=["sentiment_order"])
+            is_buy = (trades_df["sentiment"] == "buy").astype(np.int64)
+            preceding_buy_exists = (is_buy.groupby([trades_df["channel_id"], trades_df["ticker"]]).cumsum() - is_buy) > 0
+            drop_cond = (trades_df["sentiment"] == "sell") & (~preceding_buy_exists)
             # collect info about rows to be dropped
-            num_dropped = drop_cond.sum()
-            dropped_tickers = trades_df[drop_cond]['ticker'].unique()
-            
+            for channel_id, dropped in trades_df[drop_cond].groupby("channel_id", sort=False):
+                dropped_sells[channel_id] = (len(dropped), dropped["ticker"].unique())
             # remove sells without preceding buys
             trades_df = trades_df[~drop_cond]
-            # remove helper cols
-            trades_df = trades_df.drop(columns=['preceding_buy_exists', 'sentiment_order']).reset_index(drop=True)
-            if num_dropped > 0 and debug:
-                print(f"Removed {num_dropped} sell trades without preceding buy trades for the following tickers: {dropped_tickers}")
 
-        return trades_df
+        return trades_df, dropped_sells
     
 
     def _get_next_trading_day(self, date, min_days_wait):
         # given a date + waiting period, return the next trading day 
-        date = pd.to_datetime(date)
-        target_date = date + pd.Timedelta(days=min_days_wait)
-        next_trading_day = self.trading_days[self.trading_days >= target_date].min()
-
-        return next_trading_day # none if no trading day after target_date
+        return self.calendar.next_trading_day(date, min_days_wait=min_days_wait) # NaT if no trading day after target_date
 
     
     def _prep_pf_returns_data(self, unique_assets):
         # get required subsets of return data for this portfolio, and dict with data availability info
         # note: neutral asset MUST NOT be in unique_assets
         
-        ret_df = self.returns[[t for t in unique_assets if t in self.returns.columns]].copy() # avoid SettingWithCopyWarning
-        # add neutral asset as very last column (position is important!)
-        ret_df[self.neutral_asset_ticker] = self.returns[self.neutral_asset_ticker]
+        if isinstance(self.returns, SharedReturnsMatrix):
+            # only copies the required columns out of the shared block (neutral asset as very last column!)
+            ret_df = self.returns.get_columns([t for t in unique_assets if t in self.returns.columns] + [self.neutral_asset_ticker])
+        else:
+            ret_df = self.returns[[t for t in unique_assets if t in self.returns.columns]].copy() # avoid SettingWithCopyWarning
+            # add neutral asset as very last column (position is important!)
+            ret_df[self.neutral_asset_ticker] = self.returns[self.neutral_asset_ticker]
         # get shifted returns data (shifted early by 1 trading day)
         ret_df_shifted = ret_df.shift(-1)
         # get available first and last trading days for each asset in dict to make lookup possible: ret_av[ticker][...] -> date
@@ -308,6 +1149,21 @@ class PortfolioBuilder:
                 ret_av[t]["last_possible_sell"] = ret_df[t].last_valid_index() # day of last available return
         return ret_df, ret_av
     
+    def _profile(self, phase):
+        # context manager for a profiled phase of compute_portfolio (yields the phase record, or None if no profiler is set)
+        if self.profiler is None:
+            return _no_profiling
+        return self.profiler.phase(phase)
+
+    def _get_equal_weight_engine(self):
+        engine = self.settings.get("engine", "event_driven")
+        if engine == "event_driven":
+            return self._compute_equal_weight_portfolio_event_driven
+        elif engine == "daily_loop":
+            return self._compute_equal_weight_portfolio
+        else:
+            raise ValueError("Invalid engine option!")
+
     def _compute_equal_weight_portfolio(self, trades_df, returns_df, ret_av, return_before_and_after_trading_positions=True, debug=False):
         # the equal weight portfolio is computed by rebalancing all non-neutral positions to equal weight each trading day.
         return_factors_df = returns_df + 1
@@ -404,26 +1260,274 @@ class PortfolioBuilder:
 
 
         ### post-processing
-        # build positions_df from positions list
-        # note: we drop any columns (except for the neutral asset column) which are all zeros (-> e.g. due to returns data availability, or any other reason which only became apparent during the portfolio computation)
-        # this way we can take the column names of the returned positions df as unique assets actually held in the portfolio at some point
-        df = pd.DataFrame(positions_list_eod_after_trading, columns=tickers + [self.neutral_asset_ticker], index=pf_running_days)
-        positions_df_eod_after_trading = pd.concat([df.iloc[:, :-1].loc[:, (df.iloc[:, :-1] != 0).any(axis=0)], # cols without neutral asset col
-                                                    df.iloc[:, -1]], axis=1) # neutral asset col
-        if debug:
-            print(f"DEBUG: positions_df_eod_after_trading shapes before and after dropping zero cols: {df.shape}, {positions_df_eod_after_trading.shape}")
-        df = pd.DataFrame(positions_list_eod_before_trading, columns=tickers + [self.neutral_asset_ticker], index=pf_running_days)
-        positions_df_eod_before_trading = pd.concat([df.iloc[:, :-1].loc[:, (df.iloc[:, :-1] != 0).any(axis=0)], # cols without neutral asset col
-                                                    df.iloc[:, -1]], axis=1)
-        if debug:
-            print(f"DEBUG: positions_df_eod_before_trading shapes before and after dropping zero cols: {df.shape}, {positions_df_eod_before_trading.shape}")
-        # build trades_log_df from trade_logs
-        trade_logs_df = pd.DataFrame(trade_logs, columns=["trade_date", "ticker", "sentiment", "executed", "reason"])
-
-        if return_before_and_after_trading_positions:
-            return positions_df_eod_before_trading, positions_df_eod_after_trading, trade_logs_df
+        return self._build_equal_weight_outputs(positions_list_eod_before_trading, positions_list_eod_after_trading, trade_logs, tickers, pf_running_days, 
+                                                return_before_and_after_trading_positions=return_before_and_after_trading_positions, debug=debug)
+
+    def _compute_equal_weight_portfolio_event_driven(self, trades_df, returns_df, ret_av, return_before_and_after_trading_positions=True, sparse=False, debug=False):
+        # same strategy as _compute_equal_weight_portfolio, but the python trading logic only runs on "event days" (days with trades or forced sells, or days where a holding dropped to zero)
+        # on all other days the set of holdings can't change, so we only apply the day's returns and rebalance on preallocated positions matrices
+        # note: event days run the exact same set operations as the daily loop (same order, same set construction), so positions and trade logs are identical
+        running_days_mask = (self.trading_days >= self.settings["pf_start_date"]) & (self.trading_days <= self.settings["pf_end_date"])
+        positions_eod_before_trading, positions_eod_after_trading, trade_logs, pf_running_days, _ = self._run_event_driven_engine(trades_df, returns_df, ret_av, running_days_mask, 
+                                                                                                                                  sparse=sparse, debug=debug)
+        if sparse:
+            # positions are SparsePositions already, dense dfs are only built on request
+            trade_logs_df = pd.DataFrame(trade_logs, columns=["trade_date", "ticker", "sentiment", "executed", "reason"])
+            if return_before_and_after_trading_positions:
+                return positions_eod_before_trading, positions_eod_after_trading, trade_logs_df
+            return positions_eod_after_trading, trade_logs_df
+
+        ### post-processing
+        return self._build_equal_weight_outputs(positions_eod_before_trading, positions_eod_after_trading, trade_logs, returns_df.columns[:-1].tolist(), pf_running_days,
+                                                return_before_and_after_trading_positions=return_before_and_after_trading_positions, debug=debug)
+
+    def _run_event_driven_engine(self, trades_df, returns_df, ret_av, running_days_mask, initial_state=None, checkpoint_day=None, sparse=False, debug=False):
+        # runs the event-driven equal weight simulation for the running days in running_days_mask (boolean mask over self.trading_days)
+        # - initial_state: None (start with 100% neutral asset) or dict with "positions" (after trading, columns of returns_df) and "holding_days" (tickers) arrays of the day before the first running day
+        # - checkpoint_day: index of the running day whose end-of-day state should be returned (e.g. for incremental recomputation later on)
+        # - sparse: only keep the non-zero positions of each day (returned as SparsePositions) instead of dense (days x tickers+1) matrices
+        # returns positions matrices (before/after trading), trade logs, running days and the checkpoint state (None if no checkpoint_day)
+        tickers = returns_df.columns[:-1].tolist() # tickers of all considered assets for this portfolio (except neutral asset!) in correct order
+        n_tickers = len(tickers)
+        ticker_idx = {t: i for i, t in enumerate(tickers)}
+
+        pf_running_days = self.trading_days[running_days_mask]
+        dates = pf_running_days.strftime("%Y-%m-%d")
+        n_days = len(pf_running_days)
+
+        # return factors for all running days at once (rows of returns_df correspond to self.trading_days)
+        return_factors = returns_df.to_numpy()[running_days_mask] + 1
+        return_factors_na = np.isnan(return_factors)
+        return_factors_filled = np.where(return_factors_na, 1., return_factors)
+
+        # precompute buy and sell tickers per running day (keeping the row order of trades_df -> same set construction as in the daily loop)
+        trade_days = pf_running_days.get_indexer(pd.to_datetime(trades_df["trade_date"]))
+        buys_by_day, sells_by_day = {}, {}
+        for d, t, s in zip(trade_days, trades_df["ticker"], trades_df["sentiment"]):
+            if d < 0:
+                continue
+            if s == "buy":
+                buys_by_day.setdefault(d, []).append(t)
+            elif s == "sell":
+                sells_by_day.setdefault(d, []).append(t)
+
+        # days on which forced sells due to returns data availability are possible
+        date_to_day = {date: d for d, date in enumerate(dates)}
+        data_end_days = {date_to_day[ret_av[t]["last_possible_sell"]] for t in tickers if ret_av[t]["last_possible_sell"] in date_to_day}
+        scheduled_event_days = np.zeros(n_days, dtype=bool)
+        scheduled_event_days[list(buys_by_day.keys() | sells_by_day.keys() | data_end_days)] = True
+
+        # preallocated positions matrices (rows: running days, cols: tickers + neutral asset)
+        # sparse: single row buffers for the current day (the previous day's positions are only needed until the day's returns are applied)
+        positions_eod_before_trading = np.empty((1 if sparse else n_days, n_tickers + 1))
+        positions_eod_after_trading = np.empty((1 if sparse else n_days, n_tickers + 1))
+        sparse_entries_bt, sparse_entries_at = ([], []), ([], []) # (col indices, values) per day
+        if initial_state is None:
+            pos_prev = np.array([0.] * n_tickers + [self.settings["pf_initial_value"]]) # starting with 100% neutral asset
+            holding_days = np.zeros(n_tickers, dtype=np.int64) # holding days for each ticker (same as holding_days_tracker in the daily loop)
         else:
-            return positions_df_eod_after_trading, trade_logs_df
-        
-                        
+            pos_prev = np.array(initial_state["positions"], dtype=np.float64)
+            holding_days = np.array(initial_state["holding_days"], dtype=np.int64)
+        held_idx = np.flatnonzero(pos_prev[:-1] != 0) # column indices of current holdings (after trading)
+        checkpoint_state = None
+        max_holding_period = self.settings["max_holding_period"]
+
+        # helper function(s)
+        def add_to_trade_logs(trades_list, date, tickers, sentiment, executed, reason):
+            for t in tickers:
+                trades_list.append({"trade_date": date, "ticker": t, "sentiment": sentiment, "executed": executed, "reason": reason})
+
+        trade_logs = []
+
+        for d in range(n_days):
+            date = dates[d]
+            ### apply returns for the day
+            if debug:
+                # DEBUG: check if any NA return factors have non-zero pos values at the same index
+                if np.any(return_factors_na[d] & (pos_prev != 0)) and date != self.settings["pf_start_date"]:
+                    problematic_tickers = [(t, pos_prev[i], return_factors[d, i]) for i, t in enumerate(tickers) if return_factors_na[d, i] and pos_prev[i] != 0]
+                    print("ERROR: Missing return factors for non-zero positions!")
+                    print(f"Date: {date}, problematic cases (ticker, pos, return_factor): {problematic_tickers}")
+            pos = positions_eod_before_trading[0 if sparse else d]
+            np.multiply(pos_prev, return_factors_filled[d], out=pos)
+            pos_after = positions_eod_after_trading[0 if sparse else d]
+
+            # non-event day: holdings unchanged (all still > 0), no trades, no forced sells
+            is_event_day = True
+            if not scheduled_event_days[d] and (pos[held_idx] > 0).all():
+                held_holding_days = holding_days[held_idx] + 1
+                if len(held_idx) == 0 or held_holding_days.max() < max_holding_period:
+                    is_event_day = False
+                    holding_days[held_idx] = held_holding_days # tickers not held can be ignored until the next event day (reset there)
+                    pf_val = np.sum(pos)
+                    pos_after[:] = 0.
+                    if len(held_idx) == 0:
+                        pos_after[-1] = pf_val
+                    else:
+                        pos_after[held_idx] = pf_val / len(held_idx)
+
+            if is_event_day:
+                # get tickers for current holdings and update holding days
+                current_tickers = set([tickers[i] for i in np.flatnonzero(pos[:-1] > 0)]) # doesn't include neutral asset
+                holding_days = np.where(pos[:-1] > 0, holding_days + 1, 0)
+
+                ### process trades for the day (identical to daily loop)
+                # 1. BUYS
+                potential_buys = set(buys_by_day.get(d, []))
+                already_holding = potential_buys & current_tickers
+                add_to_trade_logs(trade_logs, date, already_holding, "buy", False, "ALREADY HOLDING") # not executed!
+                potential_buys = potential_buys - already_holding
+                no_returns = {t for t in potential_buys if not (ret_av[t]["has_returns"] and date >= ret_av[t]["first_possible_buy"] and date <= ret_av[t]["last_possible_buy"])}
+                add_to_trade_logs(trade_logs, date, no_returns, "buy", False, "NO RETURNS") # not executed!
+                buys = potential_buys - no_returns
+                current_tickers = current_tickers | buys
+                add_to_trade_logs(trade_logs, date, buys, "buy", True, "NORMAL") # actually executed
+
+                # 2. SELLS
+                potential_sells = set(sells_by_day.get(d, []))
+                not_holding = potential_sells - current_tickers
+                add_to_trade_logs(trade_logs, date, not_holding, "sell", False, "NOT HOLDING") # not executed!
+                sells = potential_sells - not_holding
+                current_tickers = current_tickers - sells
+                add_to_trade_logs(trade_logs, date, sells, "sell", True, "NORMAL") # actually executed
+
+                # check for forced sells
+                # - due to returns data no longer available
+                no_more_data = {t for t in current_tickers if ret_av[t]["has_returns"] and date == ret_av[t]["last_possible_sell"]}
+                add_to_trade_logs(trade_logs, date, no_more_data, "sell", True, "DATA AVAILABILITY")
+                current_tickers = current_tickers - no_more_data
+                # - due to max holding period reached
+                mhp_reached = {t for t in current_tickers if holding_days[ticker_idx[t]] >= max_holding_period}
+                add_to_trade_logs(trade_logs, date, mhp_reached, "sell", True, "MHP REACHED")
+                current_tickers = current_tickers - mhp_reached
+                # - due to max positions number reached
+                if len(current_tickers) > self.settings["max_positions"]:
+                    # determine tickers to sell (oldest ones, i.e. with highest holding days)
+                    n_to_sell = len(current_tickers) - self.settings["max_positions"]
+                    sorted_oldest_first = sorted(current_tickers, key=lambda x: holding_days[ticker_idx[x]], reverse=True)
+                    to_sell = sorted_oldest_first[:n_to_sell]
+                    add_to_trade_logs(trade_logs, date, to_sell, "sell", True, "MAX POSITIONS")
+                    current_tickers = current_tickers - set(to_sell)
+
+                ### adjust positions (rebalance to equal weight)
+                pf_val = np.sum(pos)
+                held_idx = np.array(sorted(ticker_idx[t] for t in current_tickers), dtype=np.int64)
+                pos_after[:] = 0.
+                if len(current_tickers) == 0: # case 1) no holdings left after trading -> hold only neutral asset
+                    pos_after[-1] = pf_val
+                else: # case 2) at least 1 holding -> balance to equal weight
+                    pos_after[held_idx] = pf_val / len(current_tickers)
+
+            pos_prev = pos_after
+
+            if d == checkpoint_day:
+                checkpoint_state = {"positions": pos_after.copy(), "holding_days": np.where(pos_after[:-1] != 0, holding_days, 0)}
+
+            if sparse:
+                for entries, p in [(sparse_entries_bt, pos), (sparse_entries_at, pos_after)]:
+                    nonzero_idx = np.flatnonzero(p)
+                    entries[0].append(nonzero_idx)
+                    entries[1].append(p[nonzero_idx])
+
+        if sparse:
+            columns = tickers + [self.neutral_asset_ticker]
+            positions_eod_before_trading = SparsePositions.from_daily_entries(pf_running_days, columns, *sparse_entries_bt)
+            positions_eod_after_trading = SparsePositions.from_daily_entries(pf_running_days, columns, *sparse_entries_at)
+
+        return positions_eod_before_trading, positions_eod_after_trading, trade_logs, pf_running_days, checkpoint_state
+
+    def _simulate_with_checkpoint(self, channel_id, trades_df, ret_df, ret_av, running_days_mask, initial_state=None, debug=False):
+        # run the event-driven engine and build outputs + checkpoint (end of the second-to-last running day, None if less than 2 running days)
+        checkpoint_day = running_days_mask.sum() - 2
+        pos_bt, pos_at, trade_logs, pf_running_days, state = self._run_event_driven_engine(trades_df, ret_df, ret_av, running_days_mask, initial_state=initial_state, 
+                                                                                           checkpoint_day=checkpoint_day if checkpoint_day >= 0 else None, debug=debug)
+        tickers = ret_df.columns[:-1].tolist()
+        pos_df_bt, pos_df_at, trade_logs_df = self._build_equal_weight_outputs(pos_bt, pos_at, trade_logs, tickers, pf_running_days, debug=debug)
+
+        checkpoint = None
+        if state is not None:
+            last_date = pf_running_days[checkpoint_day]
+            held = np.flatnonzero(state["positions"][:-1] != 0)
+            checkpoint = {"channel_id": channel_id,
+                          "last_date": last_date.strftime("%Y-%m-%d"), # end of day state (after trading) of this date
+                          "settings": self._get_checkpoint_settings(),
+                          "current_tickers": [tickers[i] for i in held],
+                          "positions": {tickers[i]: float(state["positions"][i]) for i in held},
+                          "holding_days": {tickers[i]: int(state["holding_days"][i]) for i in held},
+                          "neutral_asset_value": float(state["positions"][-1]),
+                          "trades_hash": self._hash_trades(trades_df, last_date), # to detect changed trades up to the checkpoint
+                          }
+        return pos_df_bt, pos_df_at, trade_logs_df, checkpoint
+
+    def _get_checkpoint_settings(self):
+        # settings which have to match to continue from a checkpoint
+        return {k: v for k, v in self.settings.items() if k not in ["pf_end_date", "engine"]}
+
+    @staticmethod
+    def _hash_trades(trades_df, until_date):
+        trades = trades_df[pd.to_datetime(trades_df["trade_date"]) <= until_date]
+        trade_strings = [f"{d}|{t}|{s}" for d, t, s in zip(pd.to_datetime(trades["trade_date"]).dt.strftime("%Y-%m-%d"), trades["ticker"], trades["sentiment"])]
+        return hashlib.sha256("\n".join(trade_strings).encode()).hexdigest()
+
+    def _build_equal_weight_outputs(self, positions_eod_before_trading, positions_eod_after_trading, trade_logs, tickers, pf_running_days, return_before_and_after_trading_positions=True, debug=False):
+        # positions can be passed as list of daily position arrays or as (days x tickers+1) matrix
+        with self._profile("postprocessing") as phase:
+            if phase is not None:
+                phase["rows"] = len(pf_running_days)
+            # build positions_df from positions list
+            # note: we drop any columns (except for the neutral asset column) which are all zeros (-> e.g. due to returns data availability, or any other reason which only became apparent during the portfolio computation)
+            # this way we can take the column names of the returned positions df as unique assets actually held in the portfolio at some point
+            df = pd.DataFrame(positions_eod_after_trading, columns=tickers + [self.neutral_asset_ticker], index=pf_running_days)
+            positions_df_eod_after_trading = pd.concat([df.iloc[:, :-1].loc[:, (df.iloc[:, :-1] != 0).any(axis=0)], # cols without neutral asset col
+                                                        df.iloc[:, -1]], axis=1) # neutral asset col
+            if debug:
+                print(f"DEBUG: positions_df_eod_after_trading shapes before and after dropping zero cols: {df.shape}, {positions_df_eod_after_trading.shape}")
+            df = pd.DataFrame(positions_eod_before_trading, columns=tickers + [self.neutral_asset_ticker], index=pf_running_days)
+            positions_df_eod_before_trading = pd.concat([df.iloc[:, :-1].loc[:, (df.iloc[:, :-1] != 0).any(axis=0)], # cols without neutral asset col
+                                                        df.iloc[:, -1]], axis=1)
+            if debug:
+                print(f"DEBUG: positions_df_eod_before_trading shapes before and after dropping zero cols: {df.shape}, {positions_df_eod_before_trading.shape}")
+            # build trades_log_df from trade_logs
+            trade_logs_df = pd.DataFrame(trade_logs, columns=["trade_date", "ticker", "sentiment", "executed", "reason"])
+
+            if return_before_and_after_trading_positions:
+                return positions_df_eod_before_trading, positions_df_eod_after_trading, trade_logs_df
+            else:
+                return positions_df_eod_after_trading, trade_logs_df
+
+
+### checkpoints (see PortfolioBuilder.append_to_portfolio)
+def save_checkpoints(checkpoints, path):
+    # checkpoints: dict channel_id -> checkpoint dict
+    with open(path, "w") as f:
+        json.dump(checkpoints, f)
+
+def load_checkpoints(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+### parallel grid runs (worker functions need to be module-level to be usable in worker processes)
+_grid_builder = None # PortfolioBuilder used by the worker process
+_grid_base_settings = None # settings of the builder before applying any job settings
+
+def _init_grid_worker(builder):
+    global _grid_builder, _grid_base_settings
+    _grid_builder = builder
+    _grid_base_settings = dict(builder.settings) if builder is not None else None
 
+def _run_grid_job(job, return_portfolio_object=False):
+    job_idx, _, settings, channel_id = job
+    start_time = time.time()
+    # reset to base settings before applying job settings (jobs of different settings are mixed within a worker)
+    _grid_builder.settings = dict(_grid_base_settings)
+    _grid_builder.update_settings(settings, verbose=False)
+    profiler = _grid_builder.profiler
+    n_records = len(profiler.records) if profiler is not None else 0
+    result = _grid_builder.compute_portfolio(channel_id=channel_id, return_portfolio_object=return_portfolio_object)
+    # hand the phase records of this job over to the calling process (the worker's profiler is a copy)
+    profile_records = None
+    if profiler is not None:
+        profile_records = profiler.records[n_records:]
+        del profiler.records[n_records:]
+    return job_idx, result, time.time() - start_time, os.getpid(), profile_records
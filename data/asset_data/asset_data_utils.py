@@ -1,39 +1,81 @@
 import requests
 import pandas as pd
+import numpy as np
 import time
 import os
+import glob
+import shutil
+import json
+import asyncio
+import random
+import datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 from api_keys import eodhd_api_key
 
 import yfinance as yf 
 
-def get_eodhd_prices_for_ticker(ticker, exchange_symbol, api_key, start_date=None, end_date=None):
-    # build url
-    url = f"https://eodhd.com/api/eod/{ticker}.{exchange_symbol}?"
+def get_eodhd_url(ticker, exchange_symbol, api_key, start_date=None, end_date=None, base_url="https://eodhd.com/api"):
+    # base_url can point to a local stand-in server (same json format) for testing
+    url = f"{base_url}/eod/{ticker}.{exchange_symbol}?"
     if start_date:
         url += f"from={start_date}&"
     if end_date:
         url += f"to={end_date}&"
     url += f"period=d&api_token={api_key}&fmt=json"
+    return url
+
+def get_eodhd_prices_for_ticker(ticker, exchange_symbol, api_key, start_date=None, end_date=None, base_url="https://eodhd.com/api"):
+    # build url
+    url = get_eodhd_url(ticker, exchange_symbol, api_key, start_date, end_date, base_url=base_url)
     # get data
     data = requests.get(url).json()
     return data
 
-def get_US_trading_dates(start_date, end_date):
+def get_US_trading_dates(start_date, end_date, calendar_path=None):
+    # calendar_path: optional json file persisting the trading days (and the covered date range), only downloaded if the requested range is not covered yet
+    if calendar_path is not None and os.path.exists(calendar_path):
+        with open(calendar_path, "r") as f:
+            calendar = json.load(f)
+        if calendar["covered_start"] <= start_date and end_date <= calendar["covered_end"]:
+            dates = np.array(calendar["dates"], dtype=object)
+            return pd.DataFrame({"date": dates[(dates >= start_date) & (dates <= end_date)]})
+        # extend covered range (trading days of the past do not change)
+        download_start, download_end = min(start_date, calendar["covered_start"]), max(end_date, calendar["covered_end"])
+    else:
+        download_start, download_end = start_date, end_date
     # AAPL is confirmed to have data for all trading days (and none for non-trading days)
-    data = get_eodhd_prices_for_ticker("AAPL", "US", eodhd_api_key, start_date, end_date)
+    data = get_eodhd_prices_for_ticker("AAPL", "US", eodhd_api_key, download_start, download_end)
     # return as single-column df
-    return pd.DataFrame(data)[["date"]]
+    dates_df = pd.DataFrame(data)[["date"]]
+    if calendar_path is not None:
+        # the covered range never extends beyond yesterday (today's/future trading days are not known yet)
+        covered_end = min(download_end, (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+        with open(calendar_path, "w") as f:
+            json.dump({"covered_start": download_start, "covered_end": covered_end, "dates": dates_df["date"].tolist()}, f)
+    # only return the requested range (the download may cover a wider range)
+    return dates_df[(dates_df["date"] >= start_date) & (dates_df["date"] <= end_date)].reset_index(drop=True)
 
 
-def full_download(tickers, exchange_symbol, start_date, end_date, save_path, progress_path, min_time_between_requests=0.1, return_exceptions_list=False, data_source_list=None):
+def full_download(tickers, exchange_symbol, start_date, end_date, save_path, progress_path, min_time_between_requests=0.1, return_exceptions_list=False, data_source_list=None, 
+                  resume=False, batch_size=100):
+    # progress_path: append-only progress log (see append_download_progress), updated after every batch_size tickers
+    # resume: continue an interrupted run with the same progress_path (skips completed and failed tickers, reuses their on-disk data), otherwise old progress is discarded
     # check if .csv already exists
     if os.path.exists(save_path):
         raise FileExistsError(f"File {save_path} already exists. Delete or move it.")
 
-    print(f"Starting download of prices for {len(tickers)} tickers from {start_date} to {end_date}.")
-    prices_df = pd.DataFrame(columns=["date"])
-    exceptions_list = []
-    for i, ticker in enumerate(tickers):
+    price_dfs, failures, batch_idx = {}, {}, 0 # per-ticker (date, price) dfs, only combined into the wide df when saving (repeated outer merges are quadratic in the number of tickers)
+    if resume:
+        price_dfs, failures, batch_idx = read_download_progress(progress_path)
+        print(f"Resuming download: {len(price_dfs)} completed and {len(failures)} failed tickers loaded from {progress_path}.")
+    else:
+        remove_download_progress(progress_path) # from previous aborted runs
+    remaining = [(i, ticker) for i, ticker in enumerate(tickers) if ticker not in price_dfs and ticker not in failures]
+
+    print(f"Starting download of prices for {len(remaining)} tickers from {start_date} to {end_date}.")
+    batch_dfs, batch_failures = {}, {}
+    for n, (i, ticker) in enumerate(remaining):
         start_time = time.time()
         # get data
         try: 
@@ -47,47 +89,392 @@ def full_download(tickers, exchange_symbol, start_date, end_date, save_path, pro
                 # convert to df, keep only date and adjusted_close columns, rename column to ticker
                 new_df = pd.DataFrame(new_json)[["date", "adjusted_close"]].rename(columns={"adjusted_close": ticker})
             elif data_source_list[i] == "yahoo":
-                # careful: yahoo end_date is exclusive while eodhd is inclusive!
-                new_df = yf.download(ticker, start=start_date, end=end_date, progress=False).reset_index()
-                # adjust column names and date format to match eodhd
-                new_df = new_df.reset_index()[["Date", "Adj Close"]].rename(columns={'Date': 'date', 'Adj Close': ticker})
-                new_df['date'] = new_df['date'].dt.strftime('%Y-%m-%d')
-
-            # outer merge with existing df on date column
-            prices_df = pd.merge(prices_df, new_df, on="date", how="outer")
+                new_df = get_yahoo_prices_df(ticker, start_date, end_date)
+
+            batch_dfs[ticker] = new_df
         except Exception as e: # exceptions should only be due to non-available data in the requested time frame
             #print(f"Error for ticker {ticker}: {e} -> skipping.")
-            exceptions_list.append((ticker, e))
+            batch_failures[ticker] = e
         # avoid minute rate limit (max 1k requests / minute -> max 1 per 0.06 seconds)
         time_since_last_request = time.time() - start_time
         if time_since_last_request < min_time_between_requests: # 0.1 to be sure
             time.sleep(min_time_between_requests - time_since_last_request)
 
-        # print progress every 100 tickers
-        if (i+1) % 100 == 0:
-            print(f"-- Progress: {i+1}/{len(tickers)} completed. (total exceptions so far: {len(exceptions_list)})")
-
-        # save intermediate results every 1k tickers (overwrite previous progress)
-        if (i+1) % 1000 == 0:
-            # read in progress if exists (might be from previous aborted runs)
-            if os.path.exists(progress_path):
-                old_progress = pd.read_csv(progress_path, sep=";")
+        # save progress after each batch (append-only)
+        if (n+1) % batch_size == 0 or n+1 == len(remaining):
+            append_download_progress(progress_path, batch_idx, batch_dfs, batch_failures)
+            price_dfs.update(batch_dfs)
+            failures.update(batch_failures)
+            batch_dfs, batch_failures = {}, {}
+            batch_idx += 1
 
-            prices_df.to_csv(progress_path, sep=";", index=False)
-            print(f"Saved intermediate progress after {i+1} tickers.")
+        # print progress every 100 tickers
+        if (n+1) % 100 == 0:
+            print(f"-- Progress: {n+1}/{len(remaining)} completed. (total exceptions so far: {len(failures) + len(batch_failures)})")
 
-    # save final results (and delete progress save(s))
-    prices_df.sort_values(by="date", ascending=True).to_csv(save_path, sep=";", index=False)
+    # save final results (columns in order of tickers) and delete progress save(s)
+    build_wide_prices_df([price_dfs[t] for t in tickers if t in price_dfs]).to_csv(save_path, sep=";", index=False)
     print(f"{'-'*30}\nCompleted all downloads and saved final results to {save_path}.")
-    if os.path.exists(progress_path):
-        os.remove(progress_path)
-        print("Deleted intermediate progress file.")
+    if remove_download_progress(progress_path):
+        print("Deleted intermediate progress files.")
     
-    # show/return exceptions
+    # show/return exceptions (exceptions of resumed tickers are only available as strings)
+    exceptions_list = [(t, failures[t]) for t in tickers if t in failures]
     #print(f"{'-'*30}\nList of exceptions which occured: {exceptions_list}")
     if return_exceptions_list:
         return exceptions_list
+
+### download progress checkpoints
+def append_download_progress(progress_path, batch_idx, price_dfs, failures):
+    # append-only checkpoint of one batch of downloaded tickers:
+    # - the batch's price data goes to a new part file f"{progress_path}.part{batch_idx}.csv" (long format: date, ticker, price)
+    # - afterwards one json line {"batch", "part_file", "completed", "failed"} is appended to the log at progress_path (a batch only counts as done once logged)
+    # price_dfs: dict ticker -> df ("date", ticker), failures: dict ticker -> exception/reason
+    part_file = f"{progress_path}.part{batch_idx}.csv"
+    long_dfs = [pd.DataFrame({"date": df["date"].to_numpy(), "ticker": ticker, "price": df.iloc[:, 1].to_numpy()}) for ticker, df in price_dfs.items()]
+    long_df = pd.concat(long_dfs, ignore_index=True) if len(long_dfs) > 0 else pd.DataFrame(columns=["date", "ticker", "price"])
+    long_df.to_csv(part_file, sep=";", index=False)
+    entry = {"batch": batch_idx, "part_file": os.path.basename(part_file), "completed": list(price_dfs.keys()), 
+             "failed": {t: (e if isinstance(e, str) else f"{type(e).__name__}: {e}") for t, e in failures.items()}}
+    with open(progress_path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def read_download_progress(progress_path):
+    # returns (price_dfs, failures, n_batches) from a progress log written by append_download_progress 
+    # (dict ticker -> df ("date", ticker), dict ticker -> failure reason, number of logged batches)
+    price_dfs, failures, n_batches = {}, {}, 0
+    if not os.path.exists(progress_path):
+        return price_dfs, failures, n_batches
+    with open(progress_path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError: # incomplete last line of an interrupted write -> batch not done
+                continue
+            part = pd.read_csv(os.path.join(os.path.dirname(progress_path), entry["part_file"]), sep=";", dtype={"date": str, "ticker": str}, 
+                               keep_default_na=False, na_values={"price": [""]}) # tickers like "NA" must not become NaN
+            for ticker, df in part.groupby("ticker", sort=False):
+                price_dfs[ticker] = pd.DataFrame({"date": df["date"].to_numpy(), ticker: df["price"].to_numpy()})
+            for ticker in entry["completed"]: # tickers without any rows
+                if ticker not in price_dfs:
+                    price_dfs[ticker] = pd.DataFrame({"date": pd.Series(dtype=str), ticker: pd.Series(dtype=float)})
+            failures.update(entry["failed"])
+            n_batches = max(n_batches, entry["batch"] + 1)
+    return price_dfs, failures, n_batches
+
+def remove_download_progress(progress_path):
+    # delete progress log and part files, returns True if anything was deleted
+    paths = glob.glob(glob.escape(progress_path) + ".part*.csv") + ([progress_path] if os.path.exists(progress_path) else [])
+    for path in paths:
+        os.remove(path)
+    return len(paths) > 0
     
+def build_wide_prices_df(price_dfs):
+    # combine per-ticker dfs (columns "date" and ticker) into one wide df ("date" column + one price column per ticker in the given order, rows sorted by date)
+    # same result as successive outer merges on "date", but with a single pivot into a preallocated (dates x tickers) array 
+    # (if a ticker has duplicate dates, the last price is kept)
+    if len(price_dfs) == 0:
+        return pd.DataFrame(columns=["date"])
+    dates = np.concatenate([df["date"].to_numpy(dtype=object) for df in price_dfs])
+    unique_dates, date_idx = np.unique(dates.astype(str), return_inverse=True) # sorted
+    prices = np.full((len(unique_dates), len(price_dfs)), np.nan)
+    col_idx = np.repeat(np.arange(len(price_dfs)), [len(df) for df in price_dfs])
+    prices[date_idx, col_idx] = np.concatenate([pd.to_numeric(df.iloc[:, 1], errors="coerce").to_numpy(dtype=np.float64) for df in price_dfs])
+    prices_df = pd.DataFrame(prices, columns=[df.columns[1] for df in price_dfs])
+    prices_df.insert(0, "date", unique_dates.astype(object))
+    return prices_df
+
+def get_yahoo_prices_df(ticker, start_date, end_date):
+    # careful: yahoo end_date is exclusive while eodhd is inclusive!
+    new_df = yf.download(ticker, start=start_date, end=end_date, progress=False).reset_index()
+    # adjust column names and date format to match eodhd
+    new_df = new_df.reset_index()[["Date", "Adj Close"]].rename(columns={'Date': 'date', 'Adj Close': ticker})
+    new_df['date'] = new_df['date'].dt.strftime('%Y-%m-%d')
+    return new_df
+
+
+### concurrent downloads
+class TokenBucket:
+    """
+    Asyncio token bucket rate limiter: allows bursts of up to `capacity` requests, refilled at `rate` tokens per second.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock: # waiting requests are served in order
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def download_prices_async(tickers, exchange_symbol, start_date, end_date, api_key=None, requests_per_minute=900, burst=20, max_concurrency=20, 
+                                max_retries=4, backoff_base=1., base_url="https://eodhd.com/api", data_source_list=None, print_every=1000, as_wide_df=True):
+    # concurrent version of the download loop in full_download (same data per ticker), use concurrent_full_download() to also save the results
+    # - requests are rate limited by a token bucket (eodhd limit: 1k requests / minute, we stay a bit below by default) and at most max_concurrency requests run at the same time
+    # - rate limit responses (429), server errors (5xx) and connection errors are retried with exponential backoff (backoff_base * 2^attempt seconds + jitter)
+    # - base_url can point to a local stand-in server serving the eodhd json format (e.g. for testing)
+    # returns (prices_df, failures): wide df with "date" column + one adjusted close column per ticker (sorted by date), and dict ticker -> failure reason
+    #         (as_wide_df=False: dict ticker -> df ("date", ticker) instead of the wide df)
+    if api_key is None:
+        api_key = eodhd_api_key
+    bucket = TokenBucket(rate=requests_per_minute / 60, capacity=burst)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency) # requests is blocking -> run requests in threads
+    loop = asyncio.get_running_loop()
+    results, failures = {}, {}
+    n_done = 0
+    start_time = time.time()
+
+    def get_json(url):
+        response = requests.get(url, timeout=60)
+        return response.status_code, (response.json() if response.status_code == 200 else response.text[:200])
+
+    async def download_ticker(i, ticker):
+        nonlocal n_done
+        try:
+            if data_source_list is not None and data_source_list[i] == "yahoo":
+                async with semaphore:
+                    results[i] = await loop.run_in_executor(executor, get_yahoo_prices_df, ticker, start_date, end_date)
+                return
+            url = get_eodhd_url(ticker=ticker if not exchange_symbol == "CC" else f"{ticker}-USD", # cryptos need suffix
+                                exchange_symbol=exchange_symbol, api_key=api_key, start_date=start_date, end_date=end_date, base_url=base_url)
+            for attempt in range(max_retries + 1):
+                await bucket.acquire()
+                async with semaphore:
+                    try:
+                        status, data = await loop.run_in_executor(executor, get_json, url)
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        status, data = None, f"{type(e).__name__}: {e}"
+                if status == 200:
+                    # convert to df, keep only date and adjusted_close columns, rename column to ticker (fails if no data is available -> failure reason)
+                    results[i] = pd.DataFrame(data)[["date", "adjusted_close"]].rename(columns={"adjusted_close": ticker})
+                    return
+                if (status is None or status == 429 or status >= 500) and attempt < max_retries:
+                    await asyncio.sleep(backoff_base * 2 ** attempt + random.uniform(0, backoff_base))
+                    continue
+                failures[ticker] = f"HTTP {status}: {data}" if status is not None else data
+                return
+        except Exception as e: # e.g. no data available in the requested time frame
+            failures[ticker] = f"{type(e).__name__}: {e}"
+        finally:
+            n_done += 1
+            if print_every and n_done % print_every == 0:
+                print(f"-- Progress: {n_done}/{len(tickers)} completed in {time.time()-start_time:.1f}s. (total failures so far: {len(failures)})")
+
+    try:
+        await asyncio.gather(*[download_ticker(i, ticker) for i, ticker in enumerate(tickers)])
+    finally:
+        executor.shutdown(wait=False)
+
+    if not as_wide_df:
+        return {tickers[i]: results[i] for i in sorted(results)}, failures
+    # same wide table as full_download (columns in order of tickers, rows sorted by date)
+    return build_wide_prices_df([results[i] for i in sorted(results)]), failures
+
+def concurrent_full_download(tickers, exchange_symbol, start_date, end_date, save_path, progress_path=None, resume=False, batch_size=500, return_failures=False, **download_kwargs):
+    # concurrent alternative to full_download (see download_prices_async for the download options), saves the same wide price table to save_path
+    # progress_path/resume: same append-only progress checkpoints as full_download (tickers are downloaded in batches of batch_size), no checkpoints if progress_path is None
+    # works in scripts and in notebooks (where an event loop is already running -> run in a separate thread)
+    if os.path.exists(save_path):
+        raise FileExistsError(f"File {save_path} already exists. Delete or move it.")
+
+    price_dfs, failures, batch_idx = {}, {}, 0
+    if progress_path is not None:
+        if resume:
+            price_dfs, failures, batch_idx = read_download_progress(progress_path)
+            print(f"Resuming download: {len(price_dfs)} completed and {len(failures)} failed tickers loaded from {progress_path}.")
+        else:
+            remove_download_progress(progress_path)
+    else:
+        batch_size = max(len(tickers), 1)
+    data_source_list = download_kwargs.pop("data_source_list", None)
+    remaining = [i for i, ticker in enumerate(tickers) if ticker not in price_dfs and ticker not in failures]
+
+    async def download_batches():
+        nonlocal batch_idx
+        for batch_start in range(0, len(remaining), batch_size):
+            batch = remaining[batch_start:batch_start + batch_size]
+            batch_dfs, batch_failures = await download_prices_async([tickers[i] for i in batch], exchange_symbol, start_date, end_date, as_wide_df=False,
+                                                                    data_source_list=[data_source_list[i] for i in batch] if data_source_list is not None else None, 
+                                                                    **download_kwargs)
+            if progress_path is not None:
+                append_download_progress(progress_path, batch_idx, batch_dfs, batch_failures)
+                batch_idx += 1
+            price_dfs.update(batch_dfs)
+            failures.update(batch_failures)
+
+    print(f"Starting concurrent download of prices for {len(remaining)} tickers from {start_date} to {end_date}.")
+    start_time = time.time()
+    try:
+        asyncio.get_running_loop()
+        loop_running = True
+    except RuntimeError:
+        loop_running = False
+    if not loop_running:
+        asyncio.run(download_batches())
+    else:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(lambda: asyncio.run(download_batches())).result()
+
+    build_wide_prices_df([price_dfs[t] for t in tickers if t in price_dfs]).to_csv(save_path, sep=";", index=False)
+    print(f"{'-'*30}\nCompleted all downloads in {time.time()-start_time:.1f}s ({len(failures)} failures) and saved final results to {save_path}.")
+    if progress_path is not None and remove_download_progress(progress_path):
+        print("Deleted intermediate progress files.")
+    if return_failures:
+        return failures
+
+### local price cache
+class PriceCache:
+    """
+    On-disk cache of daily adjusted close prices per (source, exchange, ticker), one json file per ticker with the covered (requested) date range.
+    Later requests only fetch the missing head/tail date ranges. Since adjusted prices of the whole history change with splits/dividends, 
+    top-ups overlap one cached day and the full range is re-fetched if the overlapping price changed.
+    """
+    def __init__(self, cache_dir, api_key=None, base_url="https://eodhd.com/api"):
+        self.cache_dir = cache_dir
+        self.api_key = api_key if api_key is not None else eodhd_api_key
+        self.base_url = base_url
+        self.n_requests = 0 # number of fetches (api requests) made by this object
+
+    def _path(self, source, exchange_symbol, ticker):
+        return os.path.join(self.cache_dir, source, exchange_symbol, quote(ticker, safe="") + ".json") # tickers can contain "/" etc.
+
+    def _read(self, source, exchange_symbol, ticker):
+        path = self._path(source, exchange_symbol, ticker)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write(self, entry):
+        path = self._path(entry["source"], entry["exchange"], entry["ticker"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path) # atomic, no half-written cache files
+
+    def _fetch(self, source, exchange_symbol, ticker, start_date, end_date):
+        # returns df with columns "date" and "price" (empty if no data is available in the date range)
+        self.n_requests += 1
+        if source == "eodhd":
+            data = get_eodhd_prices_for_ticker(ticker=ticker if not exchange_symbol == "CC" else f"{ticker}-USD", # cryptos need suffix
+                                               exchange_symbol=exchange_symbol, api_key=self.api_key, start_date=start_date, end_date=end_date, base_url=self.base_url)
+            if not isinstance(data, list):
+                raise ValueError(f"PriceCache: Unexpected eodhd response for ticker {ticker}: {data}")
+            if len(data) == 0:
+                return pd.DataFrame({"date": pd.Series(dtype=object), "price": pd.Series(dtype=float)})
+            return pd.DataFrame(data)[["date", "adjusted_close"]].rename(columns={"adjusted_close": "price"})
+        elif source == "yahoo":
+            # yahoo end_date is exclusive -> + 1 day (cache ranges are inclusive as for eodhd)
+            end_exclusive = (pd.to_datetime(end_date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            return get_yahoo_prices_df(ticker, start_date, end_exclusive).set_axis(["date", "price"], axis=1)
+        raise ValueError(f"PriceCache: Unknown source {source}.")
+
+    def get(self, ticker, exchange_symbol, start_date, end_date, source="eodhd"):
+        # returns df ("date", ticker) for the (inclusive) date range, fetching only what is not cached yet
+        # the covered range never extends beyond yesterday (today's/future prices may not be available yet)
+        end_date = min(end_date, (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+        entry = self._read(source, exchange_symbol, ticker)
+        if entry is None:
+            df = self._fetch(source, exchange_symbol, ticker, start_date, end_date)
+            entry = {"source": source, "exchange": exchange_symbol, "ticker": ticker, "covered_start": start_date, "covered_end": end_date, 
+                     "dates": df["date"].tolist(), "prices": df["price"].tolist()}
+            self._write(entry)
+        elif start_date < entry["covered_start"] or end_date > entry["covered_end"]:
+            entry = self._top_up(entry, start_date, end_date)
+        # subset to requested range
+        dates = np.array(entry["dates"], dtype=object)
+        in_range = (dates >= start_date) & (dates <= end_date) if len(dates) > 0 else np.zeros(0, dtype=bool)
+        return pd.DataFrame({"date": dates[in_range], ticker: np.array(entry["prices"], dtype=np.float64)[in_range]})
+
+    def _top_up(self, entry, start_date, end_date):
+        # fetch missing head/tail ranges (overlapping the first/last cached day), full re-fetch if the adjusted prices of the overlapping day changed
+        source, exchange_symbol, ticker = entry["source"], entry["exchange"], entry["ticker"]
+        cached = dict(zip(entry["dates"], entry["prices"]))
+        new_start, new_end = min(start_date, entry["covered_start"]), max(end_date, entry["covered_end"])
+        parts = []
+        consistent = True
+        if start_date < entry["covered_start"]:
+            head = self._fetch(source, exchange_symbol, ticker, start_date, entry["dates"][0] if entry["dates"] else entry["covered_start"])
+            consistent &= self._overlap_matches(head, cached, entry["dates"][0] if entry["dates"] else None)
+            parts.append(head)
+        if end_date > entry["covered_end"]:
+            tail = self._fetch(source, exchange_symbol, ticker, entry["dates"][-1] if entry["dates"] else entry["covered_end"], end_date)
+            consistent &= self._overlap_matches(tail, cached, entry["dates"][-1] if entry["dates"] else None)
+            parts.append(tail)
+
+        if consistent:
+            # combine (fetched prices take precedence on the overlapping days)
+            combined = dict(cached)
+            for part in parts:
+                combined.update(zip(part["date"], part["price"]))
+            dates = sorted(d for d in combined if new_start <= d <= new_end)
+            prices = [combined[d] for d in dates]
+        else:
+            print(f"PriceCache: Adjusted prices of {source}/{exchange_symbol}/{ticker} changed since caching (split/dividend?) -> re-fetching full range.")
+            df = self._fetch(source, exchange_symbol, ticker, new_start, new_end)
+            dates, prices = df["date"].tolist(), df["price"].tolist()
+        entry = dict(entry, covered_start=new_start, covered_end=new_end, dates=dates, prices=prices)
+        self._write(entry)
+        return entry
+
+    @staticmethod
+    def _overlap_matches(part, cached, overlap_date):
+        if overlap_date is None:
+            return True
+        fetched = part.loc[part["date"] == overlap_date, "price"]
+        if len(fetched) == 0: # overlapping day not returned anymore -> treat as changed data
+            return False
+        fetched_price, cached_price = np.array([fetched.iloc[0], cached[overlap_date]], dtype=np.float64) # None -> NaN
+        return bool(np.isclose(fetched_price, cached_price, rtol=1e-9, atol=0, equal_nan=True))
+
+    def get_many(self, tickers, exchange_symbol, start_date, end_date, data_source_list=None, min_time_between_requests=0.1, print_every=1000):
+        # cached version of full_download's download loop: returns (prices_df, failures) with the same wide df format (tickers without data are failures)
+        price_dfs, failures = [], {}
+        for i, ticker in enumerate(tickers):
+            source = data_source_list[i] if data_source_list is not None else "eodhd"
+            start_time, n_requests = time.time(), self.n_requests
+            try:
+                df = self.get(ticker, exchange_symbol, start_date, end_date, source=source)
+                if len(df) == 0:
+                    failures[ticker] = "no data in date range"
+                else:
+                    price_dfs.append(df)
+            except Exception as e:
+                failures[ticker] = f"{type(e).__name__}: {e}"
+            # rate limit (only if requests were made)
+            time_since_last_request = time.time() - start_time
+            if self.n_requests > n_requests and time_since_last_request < min_time_between_requests:
+                time.sleep(min_time_between_requests - time_since_last_request)
+            if print_every and (i+1) % print_every == 0:
+                print(f"-- Progress: {i+1}/{len(tickers)} completed ({self.n_requests} requests so far, {len(failures)} failures).")
+        return build_wide_prices_df(price_dfs), failures
+
+    def load_wide(self, tickers, exchange_symbol, start_date=None, end_date=None, data_source_list=None):
+        # bulk load cached prices (no requests) into a wide df ("date" column + one column per cached ticker), e.g. as input for get_returns_from_prices()
+        price_dfs = []
+        for i, ticker in enumerate(tickers):
+            entry = self._read(data_source_list[i] if data_source_list is not None else "eodhd", exchange_symbol, ticker)
+            if entry is None or len(entry["dates"]) == 0:
+                continue
+            dates = np.array(entry["dates"], dtype=object)
+            in_range = np.ones(len(dates), dtype=bool)
+            if start_date is not None:
+                in_range &= dates >= start_date
+            if end_date is not None:
+                in_range &= dates <= end_date
+            price_dfs.append(pd.DataFrame({"date": dates[in_range], ticker: np.array(entry["prices"], dtype=np.float64)[in_range]}))
+        return build_wide_prices_df(price_dfs)
+
 def get_returns_from_prices(prices_df, drop_full_na_cols=True):
     # prices_df needs an index or a column "date" and at least one column with prices
     # dfs passed to this function should be pre-filtered to only include price series with not too many missing valuess
@@ -119,18 +506,26 @@ def get_returns_from_prices(prices_df, drop_full_na_cols=True):
             print(f"get_returns_from_prices(): Dropped {len(dropped_cols)} return columns with all NaN values: {dropped_cols}")
 
     # check for potential issues (which should have been avoided by pre-processing the input already)
+    returns = returns_df.to_numpy(dtype=np.float64, na_value=np.nan)
     # inf values (due to zero prices)
-    if returns_df.isin([float("inf"), float("-inf")]).sum().sum() > 0:
-        inf_colnames = returns_df.columns[returns_df.isin([float("inf"), float("-inf")]).any()].tolist()
+    is_inf_col = np.isinf(returns).any(axis=0)
+    if is_inf_col.any():
+        inf_colnames = returns_df.columns[is_inf_col].tolist()
         print(f"get_returns_from_prices(): WARNING: Found infinite values in returns_df in the following columns: {inf_colnames}")
     # NaN values inbetween valid values (should not be possible when forward filling prices without limit)
-    for t in returns_df.columns:
-        # get earliest and last price
-        first_idx = returns_df[t].first_valid_index()
-        last_idx = returns_df[t].last_valid_index()
-        # check if there are NaN values inbetween
-        if returns_df.loc[first_idx:last_idx, t].isna().sum() > 0:
-            print(f"get_returns_from_prices(): WARNING: Found NaN values inbetween valid prices for ticker {t}.")
+    # (whole-matrix version of a per-column first_valid_index()/last_valid_index() check: NaN count between first and last valid row per column)
+    valid = ~np.isnan(returns)
+    n_rows = valid.shape[0]
+    if n_rows > 0:
+        first_pos = valid.argmax(axis=0)
+        last_pos = n_rows - 1 - valid[::-1].argmax(axis=0)
+        n_gaps = (last_pos - first_pos + 1) - valid.sum(axis=0)
+        # columns without any valid value count as all NaN (as .loc[None:None] selects the full column)
+        n_gaps = np.where(valid.any(axis=0), n_gaps, n_rows)
+    else:
+        n_gaps = np.zeros(valid.shape[1], dtype=int)
+    for t in returns_df.columns[n_gaps > 0]:
+        print(f"get_returns_from_prices(): WARNING: Found NaN values inbetween valid prices for ticker {t}.")
 
     return returns_df
 
@@ -160,20 +555,19 @@ def detect_errors_in_returns(returns_df, asset_type_name, drop_cols_with_likely_
     pos_return_threshold = pos_return_thresholds[asset_type_name]
     neg_return_threshold = neg_return_thresholds[asset_type_name]
 
-    # iterate over columns and check for anomalies
-    likely_error_cols = []
-    for t in returns_df.columns:
-        r = returns_df[t]
+    # check all columns for anomalies at once (column-wise extrema, NaN values are skipped)
+    max_returns, min_returns = returns_df.max(), returns_df.min()
 
-        # error condition(s)
+    # error condition(s)
 
-        # extreme return thresholds
-        if r.max() > pos_return_threshold or r.min() < neg_return_threshold:
-            likely_error_cols.append(t)
-            if print_info:
-                print(f"detect_errors_in_returns(): Ticker {t} has likely errors  (max return: {r.max()}, min return: {r.min()}")
+    # extreme return thresholds
+    is_likely_error = ((max_returns > pos_return_threshold) | (min_returns < neg_return_threshold)).to_numpy()
+    likely_error_cols = returns_df.columns[is_likely_error].tolist()
+    if print_info:
+        for i in np.flatnonzero(is_likely_error):
+            print(f"detect_errors_in_returns(): Ticker {returns_df.columns[i]} has likely errors  (max return: {max_returns.iloc[i]}, min return: {min_returns.iloc[i]}")
 
-        # z-scores?
+    # z-scores?
 
     if drop_cols_with_likely_errors:
         # drop columns with likely errors (e.g. due to faulty data)
@@ -197,24 +591,113 @@ manual_price_fixes_dict = {
     "etfs":         [],
 }
 
-def get_daily_3m_tbill_returns(start_date, end_date):
+def stream_returns_from_prices_csv(prices_path, asset_type_name, output_path, trading_dates, block_size=1000, exclude_tickers=None, sep=";"):
+    # memory-bounded version of the returns computation in price_data_gathering_and_processing.ipynb for very wide raw price csvs ("date" column + one column per ticker)
+    # the price table is processed in blocks of block_size ticker columns (peak memory ~ block size instead of universe size), per block:
+    # non-positive prices -> NaN, manual_price_fixes_dict fixes, trading day rows only, get_returns_from_prices(), detect_errors_in_returns() (dropping likely errors)
+    # output_path: .npy file with a column-major (n_trading_days, n_tickers) float64 returns matrix, written incrementally (columns are contiguous on disk, 
+    #              np.load(output_path, mmap_mode="r") can read single columns) + output_path.json with the "dates" and "columns" (see load_streamed_returns())
+    # trading_dates: single-column df with "YYYY-MM-DD" date strings (e.g. get_US_trading_dates())
+    # exclude_tickers: tickers to skip (e.g. ineligible due to too many missing prices)
+    # returns (columns, dropped_errors): tickers with returns in the output file and tickers dropped due to likely errors
+    if asset_type_name not in manual_price_fixes_dict:
+        raise ValueError(f"stream_returns_from_prices_csv(): asset_type_name must be one of {list(manual_price_fixes_dict.keys())}")
+    exclude_tickers = set(exclude_tickers) if exclude_tickers is not None else set()
+    tickers = [t for t in pd.read_csv(prices_path, sep=sep, nrows=0).columns if t != "date" and t not in exclude_tickers]
+    trading_dates = trading_dates[["date"]].set_index("date")
+
+    columns, dropped_errors = [], []
+    raw_path = output_path + ".tmp"
+    with open(raw_path, "wb") as raw:
+        for block_start in range(0, len(tickers), block_size):
+            block_tickers = tickers[block_start:block_start+block_size]
+            df = pd.read_csv(prices_path, sep=sep, usecols=["date"] + block_tickers).set_index("date")
+            # price fixes (see notebook)
+            df = df.where(df > 0, other=pd.NA)
+            for fix in manual_price_fixes_dict[asset_type_name]:
+                if fix["ticker"] in df.columns:
+                    df.loc[fix["date"], fix["ticker"]] = fix["new_val"]
+                    print(f"Applied manual price fix for {fix['ticker']} on {fix['date']}.")
+            # trading day rows only
+            prices_df = pd.merge(trading_dates, df, on="date", how="left")
+            del df
+            # returns and error detection
+            returns_df = get_returns_from_prices(prices_df, drop_full_na_cols=True)
+            returns_df, block_errors = detect_errors_in_returns(returns_df, asset_type_name, drop_cols_with_likely_errors=True)
+            # append block columns (column-major) to the raw data file
+            raw.write(returns_df.to_numpy(dtype=np.float64).tobytes(order="F"))
+            columns.extend(returns_df.columns.tolist())
+            dropped_errors.extend(block_errors)
+            print(f"-- {min(block_start + block_size, len(tickers))}/{len(tickers)} tickers processed.")
+
+    # final .npy file = npy header + raw column-major data (copied in chunks)
+    dates = trading_dates.index.sort_values().tolist() # = returns_df index (sorted by get_returns_from_prices())
+    with open(output_path, "wb") as f:
+        np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float64)), "fortran_order": True, "shape": (len(dates), len(columns))})
+        with open(raw_path, "rb") as raw:
+            shutil.copyfileobj(raw, f)
+    os.remove(raw_path)
+    with open(output_path + ".json", "w") as f:
+        json.dump({"dates": dates, "columns": columns}, f)
+    return columns, dropped_errors
+
+def load_streamed_returns(output_path, columns=None):
+    # loads (a subset of the columns of) a returns file written by stream_returns_from_prices_csv() as returns df ("date" index, same format as get_returns_from_prices())
+    with open(output_path + ".json", "r") as f:
+        meta = json.load(f)
+    returns = np.load(output_path, mmap_mode="r")
+    if columns is None:
+        columns = meta["columns"]
+    col_pos = pd.Index(meta["columns"]).get_indexer(columns)
+    if (col_pos < 0).any():
+        raise KeyError(f"load_streamed_returns(): Columns not found in {output_path}: {[c for c, i in zip(columns, col_pos) if i < 0]}")
+    return pd.DataFrame(returns[:, col_pos], index=pd.Index(meta["dates"], name="date"), columns=columns)
+
+def get_3m_tbill_rates(start_date, end_date, cache_path=None):
+    # download ^IRX (3 month us treasury bill rates) from yahoo finance, returns df with columns "date" and "annualized_pct_return" for [start_date, end_date)
+    # cache_path: optional json file persisting the rates (and the covered date range), only downloaded if the requested range is not covered yet
+    if cache_path is not None and os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if cached["covered_start"] <= start_date and end_date <= cached["covered_end"]:
+            irx = pd.DataFrame({"date": cached["dates"], "annualized_pct_return": np.array(cached["annualized_pct_returns"], dtype=np.float64)})
+            return irx[(irx["date"] >= start_date) & (irx["date"] < end_date)].reset_index(drop=True)
+        download_start, download_end = min(start_date, cached["covered_start"]), max(end_date, cached["covered_end"])
+    else:
+        download_start, download_end = start_date, end_date
+    irx = yf.download("^IRX", start=download_start, end=download_end)
+    irx = irx.reset_index().rename(columns={"Date": "date", "Adj Close": "annualized_pct_return"})[["date", "annualized_pct_return"]]
+    irx["date"] = irx["date"].dt.strftime('%Y-%m-%d')
+    if cache_path is not None:
+        # the covered range never extends beyond yesterday (today's/future rates are not available yet)
+        covered_end = min(download_end, (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+        with open(cache_path, "w") as f:
+            json.dump({"covered_start": download_start, "covered_end": covered_end, "dates": irx["date"].tolist(), "annualized_pct_returns": irx["annualized_pct_return"].tolist()}, f)
+    # only return the requested range (the download may cover a wider range)
+    return irx[(irx["date"] >= start_date) & (irx["date"] < end_date)].reset_index(drop=True)
+
+def get_daily_3m_tbill_returns(start_date, end_date, trading_dates=None, calendar_path=None, rates_cache_path=None):
     # download ^IRX (3 month us treasury bill rates) from yahoo finance and convert to EOD-to-EOD returns for US trading days
+    # trading_dates: optional single-column df with "YYYY-MM-DD" date strings (e.g. portfolio_utils.TradingCalendar(...).to_frame(start_date, end_date)), 
+    #                otherwise the trading days are downloaded via get_US_trading_dates() (persisted in calendar_path, if given)
+    # rates_cache_path: optional json file persisting the ^IRX rates (see get_3m_tbill_rates()) 
+    # -> with both files in place (and covering the date range) no downloads are needed
 
     # download annualized returns
-    irx = yf.download("^IRX", start=start_date, end=end_date)
-    irx = irx.reset_index().rename(columns={"Date": "date", "Adj Close": "annualized_pct_return"})[["date", "annualized_pct_return"]]
+    irx = get_3m_tbill_rates(start_date, end_date, cache_path=rates_cache_path)
     irx["annualized_return"] = irx["annualized_pct_return"] / 100 # 5% -> 0.05
-    irx["date"] = irx["date"].dt.strftime('%Y-%m-%d')
     # extend to full daterange (incl. weekends, holidays) and fill up missing days with previous day's value 
     df = pd.DataFrame(pd.date_range(start=start_date, end=end_date).strftime('%Y-%m-%d'), columns=["date"])
     df = pd.merge(df, irx, on="date", how="left")
     df["annualized_return"] = df["annualized_return"].ffill()
     # get daily returns from annualized values
-    df["daily_return"] = df["annualized_return"].apply(lambda x: (1+x)**(1/365)-1)
+    df["daily_return"] = (1+df["annualized_return"])**(1/365)-1
     # compute total return index (= theoretical price of the risk-free asset)
     df["total_return_index"] = (1+df["daily_return"]).cumprod()
     # now only keep trading day rows
-    df = pd.merge(get_US_trading_dates(start_date, end_date), df, on="date", how="left")
+    if trading_dates is None:
+        trading_dates = get_US_trading_dates(start_date, end_date, calendar_path=calendar_path)
+    df = pd.merge(trading_dates[["date"]], df, on="date", how="left")
     # use the index to compute trading day returns (accounting for weekends, holidays etc.)
     df["3m_tbills"] = df["total_return_index"].pct_change()
     df = df[["date", "3m_tbills"]]